@@ -0,0 +1,195 @@
+#analyze_takes.py
+#
+# Scores recorded practice takes offline with the same detection logic as
+# a live session, spreading the files over a process pool.
+#
+#   python analyze_takes.py takes/ --tonic A4 --interval 7 --out results/
+#   python analyze_takes.py --targets targets.csv --out results/ --workers 8
+#
+# targets.csv has columns path,tonic,interval (tonic as Hz or a note name
+# such as A4 or C#4) for takes that each answer a different question.
+# Every take gets a pitch track (time, f0, cents off target) at the same
+# path under <out> as under the deepest directory holding all the takes,
+# e.g. takes/a/take.wav -> <out>/a/take.track.csv, and one row in
+# <out>/verdicts.csv.
+
+import argparse
+import csv
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from wav_io import resample
+from detect_pitch import PitchDetector, SAMPLE_RATE
+
+NOTE_OFFSETS = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+
+
+def parse_tonic(text):
+    """'440', '440.0', 'A4', 'C#4' or 'Bb3' -> frequency in Hz."""
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    name, octave = text[:-1], int(text[-1])
+    semitone = NOTE_OFFSETS[name[0].upper()] + name[1:].count('#') - name[1:].count('b')
+    midi = 12 * (octave + 1) + semitone
+    return 440.0 * 2 ** ((midi - 69) / 12)
+
+
+def map_wav(path):
+    """
+    Memory-maps the sample data of a 16-bit PCM WAV without reading it.
+    Returns (samples, sample_rate) with samples shaped (frames, channels).
+    """
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError(f"{path}: not a WAV file")
+        channels = rate = bits = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path}: no data chunk")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt, channels, rate, _, _, bits = struct.unpack('<HHIIHH', f.read(16))
+                f.seek(size - 16 + (size & 1), os.SEEK_CUR)
+                if fmt not in (1, 0xFFFE) or bits != 16:
+                    raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+            elif chunk_id == b'data':
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+    if channels is None:
+        raise ValueError(f"{path}: data chunk before fmt chunk")
+    frames = size // (2 * channels)
+    samples = np.memmap(path, dtype='<i2', mode='r', offset=offset, shape=(frames, channels))
+    return samples, rate
+
+
+def analyze_take(path, tonic_freq, semitones, track_path, estimator="yin", decimate=False, tolerance_cents=50):
+    """Worker: scores one take and writes its pitch track to track_path. Returns a verdict row."""
+    started = time.perf_counter()
+    samples, rate = map_wav(path)
+    if samples.shape[1] == 1:
+        signal = samples[:, 0]
+    else:
+        # Downmixed straight to float in [-1, 1]; analyze_signal only scales int16
+        signal = samples.mean(axis=1, dtype=np.float32)
+        signal /= 32768.0
+    if rate != SAMPLE_RATE:
+        # Only mismatched rates pay for a full read
+        signal = resample(np.asarray(signal), rate, SAMPLE_RATE)
+
+    track = []
+    detector = PitchDetector(tonic_freq, semitones, tolerance_cents=tolerance_cents, analysis_thread=False,
+                             decimate=decimate, estimator=estimator, verbose=False,
+                             on_estimate=lambda t, f0, cents: track.append((t, f0, cents)))
+    correct, note = detector.analyze_signal(signal)
+
+    os.makedirs(os.path.dirname(track_path), exist_ok=True)
+    with open(track_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", "f0", "cents_off_target"])
+        for t, f0, cents in track:
+            writer.writerow([f"{t:.4f}", "" if f0 is None else f"{f0:.2f}", "" if cents is None else f"{cents:.1f}"])
+
+    voiced = [cents for _, f0, cents in track if f0 is not None]
+    return {
+        "path": path,
+        "tonic": f"{tonic_freq:.2f}",
+        "interval": semitones,
+        "correct": correct,
+        "note": note or "",
+        "voiced_frames": len(voiced),
+        "median_cents": f"{np.median(voiced):.1f}" if voiced else "",
+        "duration_sec": f"{len(signal) / SAMPLE_RATE:.2f}",
+        "analysis_sec": f"{time.perf_counter() - started:.3f}",
+    }
+
+
+def find_takes(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(".wav"):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def track_paths(paths, out_dir):
+    """<out_dir>/<path relative to the common root>.track.csv for each take, so equal basenames never collide."""
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    return [os.path.join(out_dir, os.path.splitext(os.path.relpath(os.path.abspath(path), root))[0] + ".track.csv")
+            for path in paths]
+
+
+def load_jobs(args):
+    if args.targets:
+        with open(args.targets, newline='') as f:
+            return [(row["path"], parse_tonic(row["tonic"]), int(row["interval"])) for row in csv.DictReader(f)]
+    if args.tonic is None or args.interval is None:
+        raise SystemExit("Give --tonic and --interval, or a --targets CSV")
+    tonic = parse_tonic(args.tonic)
+    return [(path, tonic, args.interval) for path in find_takes(args.paths)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score recorded takes offline.")
+    parser.add_argument("paths", nargs="*", help="WAV files or directories of them")
+    parser.add_argument("--tonic", help="tonic as Hz or a note name, e.g. A4")
+    parser.add_argument("--interval", type=int, help="target interval in semitones above the tonic")
+    parser.add_argument("--targets", help="CSV of path,tonic,interval instead of --tonic/--interval")
+    parser.add_argument("--out", default="analysis", help="output directory (default: analysis/)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes (default: all cores)")
+    parser.add_argument("--estimator", default="yin", help="pitch estimator (yin, autocorr, mpm)")
+    parser.add_argument("--decimate", action="store_true", help="downsample before estimating")
+    parser.add_argument("--tolerance", type=float, default=50, help="cents counted as a hit (default: 50)")
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args)
+    if not jobs:
+        raise SystemExit("No WAV files found")
+    os.makedirs(args.out, exist_ok=True)
+
+    started = time.perf_counter()
+    rows = []
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        tracks = track_paths([path for path, _, _ in jobs], args.out)
+        futures = {pool.submit(analyze_take, path, tonic, semitones, track, args.estimator,
+                               args.decimate, args.tolerance): path
+                   for (path, tonic, semitones), track in zip(jobs, tracks)}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"FAILED {futures[future]}: {e}", file=sys.stderr)
+                continue
+            rows.append(row)
+            print(f"{'CORRECT  ' if row['correct'] else 'INCORRECT'} {row['path']} ({row['note'] or 'no pitch'})")
+
+    rows.sort(key=lambda row: row["path"])
+    with open(os.path.join(args.out, "verdicts.csv"), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["path"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    elapsed = time.perf_counter() - started
+    audio = sum(float(row["duration_sec"]) for row in rows)
+    print(f"{len(rows)} takes ({audio:.1f} s of audio) in {elapsed:.2f} s with {args.workers} workers: "
+          f"{audio / elapsed:.0f}x real time")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
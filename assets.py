@@ -0,0 +1,114 @@
+#assets.py
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from telemetry import telemetry
+from wav_io import read_wav, resample
+
+SAMPLE_RATE = 44100
+SOUNDS_DIR = "sounds"
+BUNDLE_NAME = "bundle.bin"       # every sound as int16 at SAMPLE_RATE, back to back
+MANIFEST_NAME = "bundle.json"    # name -> offset, length and hash inside the bundle
+
+_bundle_loads = telemetry.counter("assets_bundle_loads_total", "Sounds loaded from the memory-mapped bundle")
+_file_loads = telemetry.counter("assets_file_loads_total", "Sounds loaded from WAV files")
+
+
+def samples_hash(samples):
+    return hashlib.sha256(np.ascontiguousarray(samples).tobytes()).hexdigest()
+
+
+class AssetRegistry:
+    """
+    Process-wide, load-on-first-use store for the sounds in sounds/. When a
+    bundle built by build_sound_bundle.py is present it is memory-mapped and
+    each sound is a slice of it, already at SAMPLE_RATE; otherwise, or if a
+    slice fails its hash check, the WAV file is read instead. Every asset is
+    loaded at most once per process however many sessions or metronomes ask
+    for it.
+    """
+
+    def __init__(self, sounds_dir=SOUNDS_DIR, sample_rate=SAMPLE_RATE):
+        self.sounds_dir = sounds_dir
+        self.sample_rate = sample_rate
+        self.from_bundle = 0
+        self.from_files = 0
+        self._bundle = None
+        self._manifest = None
+        self._samples = {}
+        self._sounds = {}
+        self._clips = {}
+        self._lock = threading.RLock()
+
+    def _open_bundle(self):
+        if self._manifest is not None:
+            return
+        self._manifest = {}
+        manifest_path = os.path.join(self.sounds_dir, MANIFEST_NAME)
+        bundle_path = os.path.join(self.sounds_dir, BUNDLE_NAME)
+        if not (os.path.exists(manifest_path) and os.path.exists(bundle_path)):
+            return
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("sample_rate") != self.sample_rate:
+            print(f"Sound bundle is at {manifest.get('sample_rate')} Hz, not {self.sample_rate}; "
+                  f"reading WAV files instead")
+            return
+        self._bundle = np.memmap(bundle_path, dtype='<i2', mode='r')
+        self._manifest = manifest["assets"]
+
+    def samples(self, name):
+        """int16 samples at sample_rate. Bundle slices are read-only views."""
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._load(name)
+                self._samples[name] = samples
+            return samples
+
+    def _load(self, name):
+        self._open_bundle()
+        entry = self._manifest.get(name)
+        if entry is not None:
+            samples = self._bundle[entry["offset"]:entry["offset"] + entry["length"]]
+            if samples_hash(samples) == entry["sha256"]:
+                self.from_bundle += 1
+                _bundle_loads.inc()
+                return samples
+            print(f"Sound bundle entry '{name}' failed its hash check; reading the WAV file")
+
+        samples, rate = read_wav(os.path.join(self.sounds_dir, f"{name}.wav"))
+        self.from_files += 1
+        _file_loads.inc()
+        return resample(samples, rate, self.sample_rate)
+
+    def sound(self, name):
+        """A pygame Sound for name in the mixer's actual format, created once."""
+        with self._lock:
+            sound = self._sounds.get(name)
+            if sound is None:
+                # pygame only loads here, so clip() users (the metronome) stay headless
+                from mixer import make_sound
+                sound = make_sound(self.samples(name), self.sample_rate)
+                self._sounds[name] = sound
+            return sound
+
+    def clip(self, name):
+        """float32 samples in [-1, 1] for mixing into an output stream."""
+        with self._lock:
+            clip = self._clips.get(name)
+            if clip is None:
+                clip = self.samples(name).astype(np.float32) / 32768.0
+                self._clips[name] = clip
+            return clip
+
+    def report(self):
+        return f"Assets: {self.from_bundle} loaded from the bundle, {self.from_files} from WAV files"
+
+
+assets = AssetRegistry()
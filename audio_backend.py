@@ -0,0 +1,348 @@
+#audio_backend.py
+
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from wav_io import read_wav, resample
+
+SAMPLE_RATE = 44100
+SYNTH_AMPLITUDE = 0.3
+SYNTH_HARMONICS = 3
+
+
+def wav_source(path, samplerate=SAMPLE_RATE, loop=False):
+    """Source function over a WAV file: source(position, n) -> float32 block, or None once it runs out."""
+    samples, rate = read_wav(path)
+    data = resample(samples, rate, samplerate).astype(np.float32) / 32768.0
+
+    def source(position, n):
+        if loop and len(data):
+            return np.take(data, np.arange(position, position + n), mode='wrap')
+        if position >= len(data):
+            return None
+        return data[position:position + n]
+    return source
+
+
+def synth_source(notes, samplerate=SAMPLE_RATE, harmonics=SYNTH_HARMONICS, noise=0.0,
+                 amplitude=SYNTH_AMPLITUDE, seed=0):
+    """
+    Source function that plays a script of (frequency, seconds) notes; a
+    frequency of None is silence (plus noise). A single frequency plays
+    forever.
+    """
+    if not isinstance(notes, (list, tuple)):
+        notes = [(notes, None)]
+    bounds = []
+    end = 0
+    for frequency, seconds in notes:
+        end = None if seconds is None else end + int(seconds * samplerate)
+        bounds.append((frequency, end))
+    rng = np.random.default_rng(seed)
+
+    def source(position, n):
+        if bounds[-1][1] is not None and position >= bounds[-1][1]:
+            return None
+        t = np.arange(position, position + n)
+        block = np.zeros(n)
+        start = 0
+        for frequency, stop in bounds:
+            mask = (t >= start) if stop is None else (t >= start) & (t < stop)
+            if frequency and mask.any():
+                phase = 2 * np.pi * frequency * t[mask] / samplerate
+                block[mask] = sum(np.sin(k * phase) / k for k in range(1, harmonics + 1))
+            if stop is None:
+                break
+            start = stop
+        block *= amplitude
+        if noise:
+            block += noise * rng.standard_normal(n)
+        if bounds[-1][1] is not None:
+            block = block[:max(0, bounds[-1][1] - position)]
+        return block.astype(np.float32)
+    return source
+
+
+def multichannel_source(sources):
+    """Source function with one channel per source, e.g. several synth_source() players; blocks are (n, channels)."""
+    def source(position, n):
+        blocks = [s(position, n) for s in sources]
+        if any(block is None for block in blocks):
+            return None
+        frames = min(len(block) for block in blocks)
+        return np.stack([block[:frames] for block in blocks], axis=1)
+    return source
+
+
+class SimulatedStream:
+    """
+    Drives a PortAudio-style callback(data, frames, time_info, status) from
+    its own thread, either paced to real time or as fast as the callback
+    returns. Input streams pull blocks from a source function; output
+    streams hand the callback a zeroed buffer and pass the result to sink.
+    Stream time is samples delivered / samplerate, not the wall clock.
+    With a clock.VirtualClock there is no thread: each block is a timer on
+    the clock, delivered inline by whichever thread advances it.
+    """
+
+    def __init__(self, callback, samplerate, blocksize, source=None, sink=None, realtime=True, channels=1,
+                 clock=None):
+        self.callback = callback
+        self.clock = clock if clock is not None and clock.virtual else None
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.source = source
+        self.sink = sink
+        self.realtime = realtime
+        self.channels = channels
+        self.position = 0
+        self.active = False
+        self.finished = threading.Event()
+        self._stop = threading.Event()
+        self._progress = threading.Condition()
+        self._thread = None
+        self._buffer = np.zeros((blocksize, channels), dtype=np.float32)
+
+    @property
+    def time(self):
+        return self.position / self.samplerate
+
+    def start(self):
+        if self.active:
+            return
+        self.active = True
+        if self.clock is not None:
+            self.clock.call_later(self.blocksize / self.samplerate, self._tick)
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.active = False
+
+    def close(self):
+        self.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _deliver(self):
+        """Runs the callback on one block; False once the source has run out."""
+        if self.source is not None:
+            block = self.source(self.position, self.blocksize)
+            if block is None or len(block) == 0:
+                return False
+            frames = len(block)
+            data = self._buffer[:frames]
+            if block.ndim == 2:
+                data[:] = block
+            else:
+                data[:, 0] = block
+        else:
+            frames = self.blocksize
+            data = self._buffer
+            data.fill(0)
+
+        now = self.time
+        time_info = SimpleNamespace(currentTime=now, inputBufferAdcTime=now, outputBufferDacTime=now)
+        self.callback(data, frames, time_info, None)
+        if self.sink is not None:
+            self.sink(data[:, 0])
+
+        with self._progress:
+            self.position += frames
+            self._progress.notify_all()
+        return True
+
+    def _finish(self):
+        self.active = False
+        self.finished.set()
+        with self._progress:
+            self._progress.notify_all()
+
+    def _run(self):
+        started = time.perf_counter()
+        while not self._stop.is_set():
+            if not self._deliver():
+                break
+            if self.realtime:
+                ahead = self.position / self.samplerate - (time.perf_counter() - started)
+                if ahead > 0:
+                    self._stop.wait(ahead)
+        self._finish()
+
+    def _tick(self):
+        if self._stop.is_set():
+            return
+        if not self._deliver():
+            self._finish()
+            return
+        self.clock.call_later(self.blocksize / self.samplerate, self._tick)
+
+    def wait(self, duration_sec, stop_event=None):
+        """Blocks until duration_sec of stream time has passed, the source runs out or stop_event is set."""
+        if self.clock is not None:
+            target = self.position + int(duration_sec * self.samplerate)
+            while self.position < target and not self.finished.is_set():
+                if stop_event is not None and stop_event.is_set():
+                    break
+                self.clock.wait(self.finished, self.blocksize / self.samplerate)
+            return
+        with self._progress:
+            target = self.position + int(duration_sec * self.samplerate)
+            while self.position < target and not self.finished.is_set():
+                if stop_event is not None and stop_event.is_set():
+                    break
+                self._progress.wait(0.05)
+
+
+class _LiveStream:
+    """sounddevice stream plus the wait() the simulated streams have."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    @property
+    def time(self):
+        return self.stream.time
+
+    @property
+    def active(self):
+        return self.stream.active
+
+    def start(self):
+        self.stream.start()
+
+    def stop(self):
+        self.stream.stop()
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        self.stream.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stream.stop()
+        self.stream.close()
+
+    def wait(self, duration_sec, stop_event=None):
+        if stop_event is not None:
+            stop_event.wait(duration_sec)
+        else:
+            time.sleep(duration_sec)
+
+
+class LiveBackend:
+    """The real sound card through sounddevice."""
+
+    name = "live"
+    realtime = True
+    virtual = False
+
+    def __init__(self, device=None):
+        self.device = device
+
+    def input_stream(self, samplerate, blocksize, callback, device=None, channels=1):
+        # Imported here so file and synthetic backends work on boxes without PortAudio
+        import sounddevice as sd
+        from devices import configure_devices
+        configure_devices()  # no-op once startup has done it
+        device = device if device is not None else self.device
+        return _LiveStream(sd.InputStream(device=device if device is not None else sd.default.device,
+                                          channels=channels, samplerate=samplerate, blocksize=blocksize,
+                                          dtype=np.float32, callback=callback))
+
+    def output_stream(self, samplerate, blocksize, callback, device=None, latency=None):
+        import sounddevice as sd
+        device = device if device is not None else self.device
+        return _LiveStream(sd.OutputStream(device=device, channels=1, samplerate=samplerate,
+                                           blocksize=blocksize, dtype=np.float32, latency=latency,
+                                           callback=callback))
+
+
+class SimulatedBackend:
+    """
+    Base for backends without a sound card. Input comes from make_source();
+    output is discarded, or collected in self.output when record_output is
+    set. With realtime=False both run as fast as their callbacks allow; with
+    a clock.VirtualClock they advance with it instead (see SimulatedStream).
+    """
+
+    name = None
+
+    def __init__(self, realtime=True, record_output=False, clock=None):
+        self.realtime = realtime
+        self.record_output = record_output
+        self.clock = clock
+        self.output = []
+
+    @property
+    def virtual(self):
+        """True when a VirtualClock rather than the wall clock drives the streams."""
+        return self.clock is not None and self.clock.virtual
+
+    def make_source(self, samplerate):
+        raise NotImplementedError
+
+    def input_stream(self, samplerate, blocksize, callback, device=None, channels=1):
+        return SimulatedStream(callback, samplerate, blocksize, source=self.make_source(samplerate),
+                               realtime=self.realtime, channels=channels, clock=self.clock)
+
+    def output_stream(self, samplerate, blocksize, callback, device=None, latency=None):
+        sink = (lambda block: self.output.append(block.copy())) if self.record_output else None
+        return SimulatedStream(callback, samplerate, blocksize, sink=sink, realtime=self.realtime,
+                               clock=self.clock)
+
+
+class FileBackend(SimulatedBackend):
+    """Replays a recorded WAV file as the input."""
+
+    name = "file"
+
+    def __init__(self, path, realtime=True, loop=False, record_output=False, clock=None):
+        super().__init__(realtime, record_output, clock)
+        self.path = path
+        self.loop = loop
+
+    def make_source(self, samplerate):
+        return wav_source(self.path, samplerate, self.loop)
+
+
+class SyntheticBackend(SimulatedBackend):
+    """Generated input: a steady tone, a script of (frequency, seconds) notes, or any source function."""
+
+    name = "synthetic"
+
+    def __init__(self, notes=440.0, realtime=True, noise=0.0, record_output=False, clock=None):
+        super().__init__(realtime, record_output, clock)
+        self.notes = notes
+        self.noise = noise
+
+    def make_source(self, samplerate):
+        if callable(self.notes):
+            return self.notes
+        return synth_source(self.notes, samplerate, noise=self.noise)
+
+
+BACKENDS = {backend.name: backend for backend in (LiveBackend, FileBackend, SyntheticBackend)}
+
+
+def make_backend(name="live", **kwargs):
+    """Build a backend by name ("live", "file" or "synthetic")."""
+    try:
+        cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown audio backend {name!r}; choose from {', '.join(BACKENDS)}")
+    return cls(**kwargs)
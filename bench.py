@@ -0,0 +1,272 @@
+#bench.py
+#
+# Benchmarks for the pitch and timing hot paths. Needs no audio hardware:
+# input is synthetic and the metronome runs on a simulated output stream.
+#
+#   python bench.py                        # human-readable summary
+#   python bench.py --json results.json    # also write machine-readable results
+#   python bench.py --compare old.json     # flag slowdowns against a previous run
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from check_yin import synth_tone
+from pitch_engine import (SAMPLE_RATE, FRAME_DURATION, HOP_DURATION, yin_pitch, make_estimator, ESTIMATORS,
+                          BatchYinEstimator)
+
+FRAME_DURATIONS = [0.02, 0.03, 0.05]
+PITCH_RANGES = [(50, 1000), (70, 350), (200, 1000)]
+ACCURACY_FREQS = [55.0, 82.41, 110.0, 146.83, 196.0, 261.63, 329.63, 440.0, 659.25, 880.0]
+NOISE_LEVELS = [0.0, 0.05, 0.2]
+REPEATS = 200               # timed calls per case
+ENSEMBLE_CHANNELS = [1, 2, 4, 8, 16]
+METRONOME_SECONDS = 3.0
+METRONOME_BPM = 240
+REGRESSION_TOLERANCE = 0.25  # --compare flags timings this much slower than the baseline
+
+
+def time_calls(fn, repeats):
+    """Per-call wall times in microseconds."""
+    fn()  # warm up caches and lazy allocations
+    times = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter_ns()
+        fn()
+        times[i] = (time.perf_counter_ns() - start) / 1000.0
+    return times
+
+
+def summarise(times_us):
+    return {
+        "median_us": float(np.median(times_us)),
+        "p99_us": float(np.percentile(times_us, 99)),
+        "max_us": float(times_us.max()),
+    }
+
+
+def bench_frame_cost(repeats):
+    results = []
+    for frame_duration in FRAME_DURATIONS:
+        n = int(frame_duration * SAMPLE_RATE)
+        frame = synth_tone(220.0, n, noise=0.05)
+        for min_freq, max_freq in PITCH_RANGES:
+            params = {"frame_duration": frame_duration, "window": n, "min_freq": min_freq, "max_freq": max_freq}
+            times = time_calls(lambda: yin_pitch(frame, SAMPLE_RATE, min_freq=min_freq, max_freq=max_freq),
+                               repeats)
+            results.append({"name": "yin_pitch", "params": params, **summarise(times)})
+            for name in ESTIMATORS:
+                estimator = make_estimator(name, fs=SAMPLE_RATE, window_size=n,
+                                           min_freq=min_freq, max_freq=max_freq)
+                times = time_calls(lambda: estimator.estimate(frame), repeats)
+                results.append({"name": f"estimator.{name}", "params": params, **summarise(times)})
+    return results
+
+
+def cents_error(estimate, truth):
+    return 1200 * np.log2(estimate / truth)
+
+
+def bench_accuracy():
+    results = []
+    n = int(FRAME_DURATION * SAMPLE_RATE)
+    for name in ESTIMATORS:
+        estimator = make_estimator(name, fs=SAMPLE_RATE, window_size=n, min_freq=50, max_freq=1000)
+        for noise in NOISE_LEVELS:
+            errors = []
+            octave_errors = 0
+            misses = 0
+            for freq in ACCURACY_FREQS:
+                for seed in range(3):
+                    estimate = estimator.estimate(synth_tone(freq, n, noise=noise, seed=seed))
+                    if estimate is None:
+                        misses += 1
+                        continue
+                    cents = cents_error(estimate, freq)
+                    octaves = round(cents / 1200)
+                    if octaves:
+                        octave_errors += 1
+                    errors.append(abs(cents - 1200 * octaves))
+            errors = np.array(errors) if errors else np.array([np.nan])
+            results.append({
+                "name": f"estimator.{name}",
+                "params": {"noise": noise, "cases": 3 * len(ACCURACY_FREQS)},
+                "median_cents": float(np.nanmedian(errors)),
+                "p95_cents": float(np.nanpercentile(errors, 95)),
+                "octave_errors": octave_errors,
+                "misses": misses,
+            })
+    return results
+
+
+def bench_callback(repeats):
+    from detect_pitch import PitchDetector
+
+    results = []
+    budget_us = HOP_DURATION * 1e6
+    for estimator in ESTIMATORS:
+        for decimate in (False, True):
+            detector = PitchDetector(440.0, 7, analysis_thread=False, decimate=decimate, gate=True,
+                                     estimator=estimator)
+            hop = detector.hop_size
+            # Off target (C5 against an E5 target), so a hit never short-circuits the callback
+            signal = synth_tone(523.25, hop * (repeats + 1), noise=0.02)[:, None]
+            blocks = iter(range(0, len(signal) - hop + 1, hop))
+
+            def callback():
+                i = next(blocks)
+                detector._audio_callback(signal[i:i + hop], hop, None, None)
+
+            with contextlib.redirect_stdout(io.StringIO()):  # the detector prints every estimate
+                times = time_calls(callback, repeats)
+            stats = summarise(times)
+            results.append({
+                "name": "PitchDetector._audio_callback",
+                "params": {"estimator": estimator, "decimate": decimate, "hop": hop,
+                           "frame_duration": FRAME_DURATION},
+                **stats,
+                "budget_us": budget_us,
+                "budget_used_p99": stats["p99_us"] / budget_us,
+            })
+    return results
+
+
+def bench_ensemble(repeats):
+    """Batched YIN over N channels against N separate YinEstimator calls, per hop."""
+    results = []
+    n = int(FRAME_DURATION * SAMPLE_RATE)
+    single = make_estimator("yin", fs=SAMPLE_RATE, window_size=n)
+    for channels in ENSEMBLE_CHANNELS:
+        frames = np.stack([synth_tone(ACCURACY_FREQS[i % len(ACCURACY_FREQS)], n, noise=0.05, seed=i)
+                           for i in range(channels)]).astype(np.float32)
+        batch = BatchYinEstimator(channels, fs=SAMPLE_RATE, window_size=n)
+        batched = summarise(time_calls(lambda: batch.estimate(frames), repeats))
+        looped = summarise(time_calls(lambda: [single.estimate(frame) for frame in frames], repeats))
+        results.append({
+            "name": "BatchYinEstimator.estimate",
+            "params": {"channels": channels},
+            **batched,
+            "per_channel_us": batched["median_us"] / channels,
+            "loop_median_us": looped["median_us"],
+            "speedup": looped["median_us"] / batched["median_us"],
+        })
+    return results
+
+
+def bench_metronome(seconds):
+    from audio_backend import SyntheticBackend
+    from metronome import Metronome
+
+    # Paced to real time. The simulated stream clock only advances once per
+    # output block, so lateness here includes up to one block of granularity.
+    metronome = Metronome(METRONOME_BPM, backend=SyntheticBackend(realtime=True))
+    metronome.start()
+    time.sleep(seconds)
+    metronome.stop()
+    metronome.join()
+    mean, std = metronome.jitter()
+
+    block = np.zeros((metronome.blocksize, 1), dtype=np.float32)
+    time_info = type("TimeInfo", (), {"outputBufferDacTime": 0.0, "currentTime": 0.0})()
+    mixer = Metronome(METRONOME_BPM * 4, backend=SyntheticBackend(realtime=False))
+    times = time_calls(lambda: mixer._audio_callback(block, len(block), time_info, None), REPEATS * 5)
+    return [
+        {"name": "Metronome.dispatch", "params": {"bpm": METRONOME_BPM, "seconds": seconds},
+         "beats": metronome.beats_fired, "late_mean_ms": mean * 1000, "late_std_ms": std * 1000,
+         "late_max_ms": metronome.max_late * 1000, "drift_ms": metronome.max_drift * 1000},
+        {"name": "Metronome._audio_callback", "params": {"bpm": METRONOME_BPM * 4, "block": len(block)},
+         **summarise(times), "budget_us": len(block) / SAMPLE_RATE * 1e6},
+    ]
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
+
+
+def case_key(suite, result):
+    return (suite, result["name"], json.dumps(result["params"], sort_keys=True))
+
+
+def compare(results, baseline_path, tolerance=REGRESSION_TOLERANCE):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {case_key(suite, r): r for suite, rs in baseline["suites"].items() for r in rs}
+    regressions = []
+    for suite, rs in results["suites"].items():
+        for r in rs:
+            before = old.get(case_key(suite, r))
+            if before and "median_us" in r and "median_us" in before:
+                ratio = r["median_us"] / before["median_us"]
+                if ratio > 1 + tolerance:
+                    regressions.append(f"{suite}: {r['name']} {r['params']} "
+                                       f"{before['median_us']:.1f} -> {r['median_us']:.1f} us ({ratio:.2f}x)")
+    return regressions
+
+
+def print_summary(results):
+    for suite, rs in results["suites"].items():
+        print(f"\n[{suite}]")
+        for r in rs:
+            metrics = ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}"
+                                for k, v in r.items() if k not in ("name", "params"))
+            print(f"  {r['name']} {r['params']}: {metrics}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pitch and timing hot paths.")
+    parser.add_argument("--json", help="write machine-readable results to this file ('-' for stdout)")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run; exit 1 on slowdowns")
+    parser.add_argument("--quick", action="store_true", help="fewer repeats and a shorter metronome run")
+    args = parser.parse_args(argv)
+
+    repeats = REPEATS // 5 if args.quick else REPEATS
+    # With --json - stdout carries only the JSON; anything a module prints goes to stderr
+    with contextlib.redirect_stdout(sys.stderr if args.json == "-" else sys.stdout):
+        results = {
+            "environment": environment(),
+            "suites": {
+                "frame_cost": bench_frame_cost(repeats),
+                "accuracy": bench_accuracy(),
+                "callback": bench_callback(repeats),
+                "ensemble": bench_ensemble(repeats),
+                "metronome": bench_metronome(METRONOME_SECONDS / 3 if args.quick else METRONOME_SECONDS),
+            },
+        }
+
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        print_summary(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare)
+        for line in regressions:
+            print(f"SLOWER {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
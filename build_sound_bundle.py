@@ -0,0 +1,71 @@
+#build_sound_bundle.py
+#
+# Packs every WAV in sounds/ (the output of generate_click_wav.py and the
+# generate_*.sh scripts) into sounds/bundle.bin plus a sounds/bundle.json
+# manifest. Re-run it after regenerating any sound.
+
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from assets import SAMPLE_RATE, SOUNDS_DIR, BUNDLE_NAME, MANIFEST_NAME, samples_hash
+from wav_io import read_wav, resample
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def build_bundle(sounds_dir=SOUNDS_DIR, sample_rate=SAMPLE_RATE):
+    names = sorted(f[:-4] for f in os.listdir(sounds_dir) if f.endswith(".wav"))
+    entries = {}
+    chunks = []
+    offset = 0
+    for name in names:
+        path = os.path.join(sounds_dir, f"{name}.wav")
+        samples, rate = read_wav(path)
+        samples = resample(samples, rate, sample_rate)
+        entries[name] = {
+            "offset": offset,
+            "length": len(samples),
+            "sha256": samples_hash(samples),
+            "source": f"{name}.wav",
+            "source_sha256": file_hash(path),
+        }
+        chunks.append(samples)
+        offset += len(samples)
+
+    bundle_path = os.path.join(sounds_dir, BUNDLE_NAME)
+    manifest_path = os.path.join(sounds_dir, MANIFEST_NAME)
+    # Write to temporary names and swap in, so a running app never maps a half-written bundle
+    np.concatenate(chunks).astype('<i2').tofile(bundle_path + ".tmp")
+    with open(manifest_path + ".tmp", 'w') as f:
+        json.dump({"version": 1, "sample_rate": sample_rate, "assets": entries}, f, indent=2)
+    os.replace(bundle_path + ".tmp", bundle_path)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    print(f"Packed {len(names)} sounds ({offset} samples at {sample_rate} Hz) into {bundle_path}")
+    return entries
+
+
+def check_bundle(sounds_dir=SOUNDS_DIR):
+    """Lists sounds whose WAV changed (or appeared) since the bundle was built."""
+    with open(os.path.join(sounds_dir, MANIFEST_NAME)) as f:
+        entries = json.load(f)["assets"]
+    stale = []
+    for name in sorted(f[:-4] for f in os.listdir(sounds_dir) if f.endswith(".wav")):
+        entry = entries.get(name)
+        if entry is None or entry["source_sha256"] != file_hash(os.path.join(sounds_dir, f"{name}.wav")):
+            stale.append(name)
+    return stale
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        stale = check_bundle()
+        print("Bundle is up to date" if not stale else f"Out of date: {', '.join(stale)}")
+        raise SystemExit(1 if stale else 0)
+    build_bundle()
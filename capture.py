@@ -0,0 +1,148 @@
+#capture.py
+
+import threading
+import time
+
+from audio_backend import LiveBackend
+from ring_buffer import SampleRing
+from telemetry import telemetry
+
+SAMPLE_RATE = 44100
+BLOCK_DURATION = 0.01
+HISTORY_DURATION = 5.0   # how much live audio the shared ring keeps
+PREROLL_DURATION = 0.03  # audio before subscribe() that a trial also sees
+
+_overflows = telemetry.counter("audio_input_overflows_total", "Input blocks PortAudio dropped before we read them")
+
+
+class Subscription:
+    """
+    A reader over a time window [start, end) of the capture ring, in absolute
+    sample positions. Has the same available/read/skip interface as
+    SampleRing, so a PitchDetector can drain either one.
+    """
+
+    def __init__(self, ring, start, end, data_ready, granularity=1, preroll=0):
+        self.ring = ring
+        self.start = start
+        self.end = end
+        self.granularity = granularity
+        self.preroll = preroll   # samples of the window from before subscribe()
+        self.read_pos = start
+        self.lost = 0
+        self.data_ready = data_ready
+
+    def available(self):
+        return min(self.ring.written, self.end) - self.read_pos
+
+    def finished(self):
+        return self.read_pos >= self.end
+
+    def caught_up(self):
+        """
+        True while the reader is waiting for more input: everything it can
+        read in whole granules is consumed and its window is still open.
+        """
+        return not self.finished() and self.available() < self.granularity
+
+    def skip(self, n):
+        self.read_pos += n
+
+    def read(self, out):
+        oldest = self.ring.written - self.ring.capacity
+        if self.read_pos < oldest:
+            self.lost += oldest - self.read_pos
+            self.read_pos = oldest
+        self.ring.copy_at(self.read_pos, out)
+        self.read_pos += len(out)
+        return out
+
+
+class CaptureService:
+    """
+    Keeps one input stream open for a whole session and writes every block
+    into a shared ring. Trials call subscribe() to get a window of the live
+    feed instead of opening their own stream. With channels > 1 (one
+    player per input of a multi-input interface) the ring holds
+    (samples, channels) frames.
+    """
+
+    def __init__(self, samplerate=SAMPLE_RATE, blocksize=None, device=None, backend=None, channels=1):
+        self.samplerate = samplerate
+        self.blocksize = blocksize or int(BLOCK_DURATION * samplerate)
+        self.device = device
+        self.backend = backend or LiveBackend()
+        self.channels = channels
+        self.ring = SampleRing(int(HISTORY_DURATION * samplerate), channels=channels if channels > 1 else None)
+        self.overflow_count = 0
+        self._subscriptions = ()
+        self._sub_lock = threading.Lock()
+        self._stream = None
+        # An unpaced simulated backend is held back until readers catch up;
+        # see _wait_for_readers. On a virtual clock the readers themselves
+        # deliver each block, so there is nothing to wait for.
+        self._throttle = not self.backend.realtime and not self.backend.virtual
+        self._stopping = False
+
+    def _audio_callback(self, indata, frames, time_info, status):
+        if status and status.input_overflow:
+            self.overflow_count += 1
+            _overflows.inc()
+        self.ring.write(indata[:, 0] if self.channels == 1 else indata)
+        for sub in self._subscriptions:
+            sub.data_ready.set()
+        if self._throttle:
+            self._wait_for_readers()
+
+    def _wait_for_readers(self):
+        # Unpaced input would lap the readers and overwrite audio they have
+        # not analysed, differently on every run. Hold the producer until
+        # every subscriber has read what was written, and between windows
+        # until the next one subscribes, so a replay is reproducible.
+        while not self._stopping:
+            subs = self._subscriptions
+            if subs and all(sub.caught_up() for sub in subs):
+                return
+            time.sleep(0.0002)
+
+    def start(self):
+        if self._stream is not None:
+            return
+        self.ring.reset()
+        self._stopping = False
+        self._stream = self.backend.input_stream(self.samplerate, self.blocksize, self._audio_callback,
+                                                 device=self.device, channels=self.channels)
+        self._stream.start()
+
+    def stop(self):
+        if self._stream is None:
+            return
+        self._stopping = True
+        self._stream.stop()
+        self._stream.close()
+        self._stream = None
+
+    def is_running(self):
+        # A file-backed stream goes inactive by itself once the file runs out
+        return self._stream is not None and self._stream.active
+
+    def subscribe(self, duration_sec, data_ready, preroll_sec=PREROLL_DURATION, granularity=1):
+        """
+        Window from preroll_sec before now to duration_sec after it. Its
+        length is rounded up to a multiple of granularity, so a reader that
+        only consumes whole hops still reaches the end.
+        """
+        now = self.ring.written
+        start = max(0, now - int(preroll_sec * self.samplerate))
+        end = now + int(duration_sec * self.samplerate)
+        end = start + -(-(end - start) // granularity) * granularity
+        sub = Subscription(self.ring, start, end, data_ready, granularity, preroll=now - start)
+        # The callback iterates over a tuple snapshot, so swapping in a new
+        # tuple never blocks it.
+        with self._sub_lock:
+            self._subscriptions = self._subscriptions + (sub,)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._sub_lock:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not sub)
@@ -0,0 +1,50 @@
+#check_capture.py
+#
+# Listening windows on a session-long CaptureService must end on time
+# whatever the window length, including lengths that are not a whole
+# number of analysis hops (e.g. a bar at 70, 90, 110 or 140 BPM), for a
+# solo PitchDetector and for an EnsembleDetector on a multichannel capture.
+
+import threading
+
+from audio_backend import SyntheticBackend, multichannel_source, synth_source
+from capture import CaptureService
+from detect_pitch import PitchDetector, EnsembleDetector
+
+DURATIONS = [0.5, 0.505, 60 / 70 * 4, 60 / 90 * 4, 60 / 110 * 4, 60 / 140 * 4]
+SLACK_SEC = 2.0
+
+
+def check_windows(label, capture, detector):
+    failures = 0
+    capture.start()
+    try:
+        for duration in DURATIONS:
+            done = threading.Event()
+            listener = threading.Thread(target=lambda: (detector.detect_pitch_within_bar(duration),
+                                                        done.set()), daemon=True)
+            listener.start()
+            ok = done.wait(duration + SLACK_SEC)
+            print(f"{'OK  ' if ok else 'FAIL'} {label} window {duration:.3f} s: "
+                  f"{'returned' if ok else 'still listening'}")
+            failures += not ok
+            if not ok:
+                detector.stop()
+                break
+    finally:
+        capture.stop()
+    return failures
+
+
+def check():
+    capture = CaptureService(backend=SyntheticBackend(realtime=False))
+    failures = check_windows("solo", capture, PitchDetector(440.0, 7, capture=capture, verbose=False))
+
+    players = multichannel_source([synth_source(659.25), synth_source(554.37)])
+    capture = CaptureService(backend=SyntheticBackend(players, realtime=False), channels=2)
+    ensemble = EnsembleDetector(440.0, 7, 2, capture=capture, verbose=False)
+    return failures + check_windows("ensemble", capture, ensemble)
+
+
+if __name__ == "__main__":
+    raise SystemExit(1 if check() else 0)
@@ -0,0 +1,69 @@
+import numpy as np
+
+from pitch_engine import yin_pitch, yin_pitch_reference, YinEstimator, SAMPLE_RATE, FRAME_DURATION
+
+TEST_FREQS = [55.0, 82.41, 110.0, 196.0, 261.63, 329.63, 440.0, 659.25, 880.0]
+MAX_CENTS_ERROR = 1.0
+
+
+def synth_tone(frequency, n_samples, harmonics=3, noise=0.0, seed=0):
+    t = np.arange(n_samples) / SAMPLE_RATE
+    tone = sum(np.sin(2 * np.pi * frequency * k * t) / k for k in range(1, harmonics + 1))
+    if noise:
+        tone += noise * np.random.default_rng(seed).standard_normal(n_samples)
+    return (0.3 * tone).astype(np.float32)
+
+
+def check(n_samples=int(FRAME_DURATION * SAMPLE_RATE)):
+    failures = 0
+    for freq in TEST_FREQS:
+        for noise in (0.0, 0.05):
+            signal = synth_tone(freq, n_samples, noise=noise)
+            expected = yin_pitch_reference(signal, SAMPLE_RATE)
+            actual = yin_pitch(signal, SAMPLE_RATE)
+
+            if expected is None or actual is None:
+                ok = expected is None and actual is None
+                detail = f"reference={expected}, fft={actual}"
+            else:
+                cents = 1200 * abs(np.log2(actual / expected))
+                ok = cents <= MAX_CENTS_ERROR
+                detail = f"reference={expected:.3f} Hz, fft={actual:.3f} Hz, Δ {cents:.3f} cents"
+
+            print(f"{'OK  ' if ok else 'FAIL'} {freq:8.2f} Hz noise={noise:.2f}: {detail}")
+            failures += not ok
+    return failures
+
+
+def on_target(frequency, target_midi):
+    if frequency is None:
+        return False
+    cents = (1200 * np.log2(frequency / 440.0) + 6900 - 100 * target_midi) % 1200
+    return min(cents, 1200 - cents) <= 50
+
+
+def check_target_search(n_samples=SAMPLE_RATE // 2):
+    # The target-restricted search must give the full search's verdict,
+    # including for a noisy note a fifth above the target, whose dip at
+    # three times its period falls in the target's lower-octave band
+    failures = 0
+    for target_midi, sung in ((66, 66), (66, 73), (66, 78), (57, 64), (69, 57)):
+        for noise in (0.0, 0.1):
+            frequency = 440.0 * 2 ** ((sung - 69) / 12)
+            signal = synth_tone(frequency, n_samples, noise=noise, seed=1)
+            full, restricted = YinEstimator(), YinEstimator()
+            restricted.set_target(target_midi % 12, center_midi=target_midi)
+            expected, actual = [], []
+            full.process(signal, expected.append)
+            restricted.process(signal, actual.append)
+            wrong = sum(on_target(a, target_midi) != on_target(b, target_midi)
+                        for a, b in zip(expected, actual))
+            ok = wrong == 0 and len(expected) == len(actual)
+            print(f"{'OK  ' if ok else 'FAIL'} target {target_midi} sung {sung} noise={noise:.2f}: "
+                  f"{wrong} of {len(expected)} verdicts differ")
+            failures += not ok
+    return failures
+
+
+if __name__ == "__main__":
+    raise SystemExit(1 if check() + check_target_search() else 0)
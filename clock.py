@@ -0,0 +1,79 @@
+#clock.py
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class RealClock:
+    """Wall-clock time; waits really block."""
+
+    virtual = False
+
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout=None):
+        return event.wait(timeout)
+
+    def call_at(self, when, action, *args):
+        timer = threading.Timer(max(0.0, when - self.now()), action, args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+
+class VirtualClock:
+    """
+    Simulated time for running whole sessions faster than real time.
+    Nothing happens on its own: whichever thread waits or sleeps advances
+    the clock straight to the next timer and runs it inline, until the
+    event it waits for is set or its timeout is reached. With everything
+    driven from one thread, a session runs deterministically in however
+    long its Python work takes.
+    """
+
+    virtual = True
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._timers = []   # heap of (when, seq, action, args)
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+
+    def now(self):
+        return self._now
+
+    def call_at(self, when, action, *args):
+        with self._lock:
+            heapq.heappush(self._timers, (when, next(self._seq), action, args))
+
+    def call_later(self, delay, action, *args):
+        self.call_at(self._now + delay, action, *args)
+
+    def wait(self, event, timeout=None):
+        deadline = None if timeout is None else self._now + timeout
+        while not event.is_set():
+            with self._lock:
+                if not self._timers or (deadline is not None and self._timers[0][0] > deadline):
+                    if deadline is None:
+                        raise RuntimeError("VirtualClock.wait() would block forever: no timers left")
+                    self._now = max(self._now, deadline)
+                    return False
+                when, _, action, args = heapq.heappop(self._timers)
+                self._now = max(self._now, when)
+            action(*args)
+        return True
+
+    def sleep(self, seconds):
+        self.wait(threading.Event(), seconds)
+
+    def pending(self):
+        return len(self._timers)
+
+
+real_clock = RealClock()
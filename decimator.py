@@ -0,0 +1,65 @@
+#decimator.py
+
+import numpy as np
+
+MIN_SAMPLES_PER_PERIOD = 8  # keep at least this many samples per period of max_freq
+TAPS_PER_FACTOR = 8         # FIR length relative to the decimation factor
+
+
+def decimation_factor(fs, max_freq):
+    """Largest integer factor that still leaves MIN_SAMPLES_PER_PERIOD samples per period of max_freq."""
+    return max(1, int(fs // (max_freq * MIN_SAMPLES_PER_PERIOD)))
+
+
+def lowpass_taps(factor, num_taps=None):
+    # Windowed-sinc low-pass with its cutoff a little under the new Nyquist
+    num_taps = num_taps or TAPS_PER_FACTOR * factor + 1
+    cutoff = 0.8 * 0.5 / factor  # cycles per input sample
+    n = np.arange(num_taps) - (num_taps - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(num_taps)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+class Decimator:
+    """
+    Streaming anti-alias low-pass + downsample by an integer factor. The last
+    len(taps) - 1 input samples and the output phase are carried across
+    calls, so blocks of any size give the same output as one long signal.
+    """
+
+    __slots__ = ('factor', 'taps', '_buf', '_out', '_phase')
+
+    def __init__(self, factor, num_taps=None, max_block=4096):
+        self.factor = factor
+        self.taps = lowpass_taps(factor, num_taps)
+        self._buf = np.zeros(len(self.taps) - 1 + max_block, dtype=np.float32)
+        self._out = np.empty(max_block // factor + 1, dtype=np.float32)
+        self._phase = 0
+
+    def reset(self):
+        self._buf[:len(self.taps) - 1] = 0
+        self._phase = 0
+
+    def process(self, block):
+        """Filter and decimate block. Returns a view that is only valid until the next call."""
+        n = len(block)
+        history = len(self.taps) - 1
+        if history + n > len(self._buf):
+            # Larger block than we sized for; grow once and keep the state
+            grown = np.zeros(history + n, dtype=np.float32)
+            grown[:history] = self._buf[:history]
+            self._buf = grown
+            self._out = np.empty(n // self.factor + 1, dtype=np.float32)
+
+        buf = self._buf
+        buf[history:history + n] = block
+
+        # Window w ends at block sample w; keep every factor-th one from the carried phase
+        windows = np.lib.stride_tricks.sliding_window_view(buf[:history + n], len(self.taps))
+        picked = windows[self._phase::self.factor]
+        out = self._out[:len(picked)]
+        np.matmul(picked, self.taps, out=out)  # taps are symmetric, so no flip needed
+
+        self._phase = (self._phase - n) % self.factor
+        buf[:history] = buf[n:n + history]
+        return out
@@ -1,65 +1,25 @@
 # detect_pitch.py
 
 import numpy as np
-import sounddevice as sd
 import threading
-import time
-from math import log2
+from math import sqrt
+
+from audio_backend import LiveBackend
+from clock import real_clock
+from ring_buffer import SampleRing
+from decimator import Decimator, decimation_factor
+from gate import SignalGate
+from telemetry import telemetry
+from pitch_engine import (SAMPLE_RATE, FRAME_DURATION, HOP_DURATION, BatchYinEstimator, make_estimator,
+                          TARGET_OCTAVE_SPAN)
 
 NOTE_NAMES = ['C', 'C#/Db', 'D', 'D#/Eb', 'E', 'F', 'F#/Gb', 'G', 'G#/Ab', 'A', 'A#/Bb', 'B']
-SAMPLE_RATE = 44100
-FRAME_DURATION = 0.03
-
-devices = sd.query_devices()
-internal_mic = [i for i, d in enumerate(devices) if "Microphone" in d['name']]
-if internal_mic:
-    sd.default.device = (internal_mic[0], 1)
-
-def yin_pitch(signal, fs, w_len=None, threshold=0.15, min_freq=50, max_freq=1000):
-    if w_len is None:
-        w_len = len(signal)
-
-    signal = signal[:w_len]
-    # Step 1: Difference function
-    d = np.zeros(w_len // 2)
-    for tau in range(1, len(d)):
-        diff = signal[:-tau] - signal[tau:]
-        d[tau] = np.sum(diff ** 2)
-
-    # Step 2: Cumulative mean normalized difference function
-    d[0] = 1  # prevent division by zero
-    cumulative_sum = np.cumsum(d[1:])  # cumulative sum excluding d[0]
-    d_prime = np.empty_like(d)
-    d_prime[0] = 1
-    for tau in range(1, len(d)):
-        d_prime[tau] = d[tau] * tau / cumulative_sum[tau - 1] if cumulative_sum[tau - 1] != 0 else 1
-
-    # Step 3: Absolute threshold
-    candidates = np.where(d_prime < threshold)[0]
-    if len(candidates) == 0:
-        return None  # no pitch found below threshold
-
-    tau = candidates[0]
-
-    # Step 4: Parabolic interpolation for better precision
-    if tau + 1 < len(d_prime) and tau - 1 >= 0:
-        y0, y1, y2 = d_prime[tau - 1], d_prime[tau], d_prime[tau + 1]
-        denom = 2 * (2 * y1 - y2 - y0)
-        if denom != 0:
-            tau_adjusted = tau + (y2 - y0) / denom
-        else:
-            tau_adjusted = tau
-    else:
-        tau_adjusted = tau
-
-    # Step 5: Convert lag to frequency
-    frequency = fs / tau_adjusted
-
-    # Filter frequencies outside the allowed range
-    if frequency < min_freq or frequency > max_freq:
-        return None
-
-    return frequency
+RING_DURATION = 0.5    # capture ring between the audio callback and the analysis thread
+
+_overflows = telemetry.counter("audio_input_overflows_total", "Input blocks PortAudio dropped before we read them")
+_dropped = telemetry.counter("pitch_dropped_frames_total", "Hops skipped because analysis fell behind")
+_onset_to_verdict = telemetry.histogram("onset_to_verdict_seconds",
+                                        "Audio time from the note onset to the frame that hit the target")
 
 def freq_to_midi(freq):
     return 69 + 12 * np.log2(freq / 440.0)
@@ -82,63 +42,328 @@ def pitch_class_difference(m_detected, m_target):
         semitone_diff -= 12
     return semitone_diff * 100  # Convert to cents
 
+def cents_off_target(m_detected, m_target):
+    """Signed distance in cents to the nearest octave of the target (±600 max), not rounded to semitones."""
+    return ((m_detected - m_target + 6) % 12 - 6) * 100
+
 class PitchDetector:
-    def __init__(self, tonic_freq, target_interval_semitones, tolerance_cents=50):
-        self.tonic_freq = tonic_freq
-        self.target_interval_semitones = target_interval_semitones
+    def __init__(self, tonic_freq, target_interval_semitones, tolerance_cents=50, hop_size=None,
+                 analysis_thread=True, capture=None, early_exit_frames=None,
+                 target_search=False, octave_span=TARGET_OCTAVE_SPAN, decimate=False, max_freq=1000,
+                 gate=True, estimator="yin", backend=None, verbose=True, on_estimate=None, trace=None,
+                 clock=None):
         self.tolerance_cents = tolerance_cents
         self.stop_event = threading.Event()
         self.correct_detected = False
         self.last_detected_note = None
+        self.hit_time = None   # seconds into the listen when the target was first hit
+        self.onset_time = None  # seconds into the listen of the latest note onset
+        self._preroll = 0       # samples analysed from before the listen began (a capture's preroll)
+
+        # on_estimate(time_sec, pitch, cents_diff) sees every estimate, with
+        # time measured in input samples since listening started; verbose
+        # prints each detection as before.
+        self.verbose = verbose
+        self.on_estimate = on_estimate
+        self.samples_seen = 0
+
+        # Optional pitch_trace.TraceRecorder: one binary row per estimate,
+        # with the RMS of the hop that produced it
+        self.trace = trace
+        self._rms = 0.0
+
+        # When set, listening ends as soon as this many consecutive frames
+        # land on the target pitch class instead of running the full window.
+        self.early_exit_frames = early_exit_frames
+        self.exited_early = False
+        self._consecutive_hits = 0
         self._lock = threading.Lock()
 
+        # target_search limits YIN to the lag bands of the expected pitch
+        # class first (within octave_span octaves of the target; None for all)
+        self.target_search = target_search
+        self.octave_span = octave_span
+
+        # Window and hop at the input rate. With decimate, blocks are
+        # low-passed and downsampled to a rate that still resolves max_freq
+        # before YIN sees them, and YIN runs at that lower rate.
+        self.hop_size = hop_size or int(HOP_DURATION * SAMPLE_RATE)
+        self.window_size = int(FRAME_DURATION * SAMPLE_RATE)
+        factor = decimation_factor(SAMPLE_RATE, max_freq) if decimate else 1
+        self.decimator = Decimator(factor) if factor > 1 else None
+        analysis_rate = SAMPLE_RATE / factor
+        self.estimator = make_estimator(estimator,
+                                        fs=analysis_rate,
+                                        window_size=int(FRAME_DURATION * analysis_rate),
+                                        hop_size=max(1, self.hop_size // factor),
+                                        max_freq=max_freq)
+        self.set_target(tonic_freq, target_interval_semitones)
+
+        # Silent hops skip YIN entirely; see gate.SignalGate
+        self.gate = SignalGate(self.hop_size) if gate else None
+
+        # With analysis_thread the PortAudio callback only copies samples into
+        # the ring; YIN runs on a separate worker that drains it.
+        self.analysis_thread = analysis_thread
+        self.overflow_count = 0   # input overflows reported by PortAudio
+        self.dropped_frames = 0   # hops skipped because the worker fell behind
+        self._ring = SampleRing(int(RING_DURATION * SAMPLE_RATE))
+        self._source = self._ring
+        self._chunk = np.empty(self.hop_size, dtype=np.float32)
+        self._data_ready = threading.Event()
+        self._worker_stop = threading.Event()
+
+        # A session-wide CaptureService replaces the per-call InputStream;
+        # each listen then just subscribes to a window of its feed.
+        self.capture = capture
+        # Where audio comes from without a capture service: the sound card,
+        # a WAV file or a generator (see audio_backend)
+        self.backend = backend or LiveBackend()
+        if not self.backend.realtime or self.backend.virtual:
+            # An unpaced simulated stream delivers blocks as fast as the
+            # callback returns, so a worker would fall behind and drop a
+            # different number of hops every run, and on a virtual clock
+            # blocks arrive on the listening thread. Analyse inline instead.
+            self.analysis_thread = False
+        # Listening waits on this clock, so with a clock.VirtualClock (and a
+        # capture on a backend driven by it) a listen advances simulated time
+        self.clock = clock or real_clock
+
+    def set_target(self, tonic_freq, target_interval_semitones):
+        self.tonic_freq = tonic_freq
+        self.target_interval_semitones = target_interval_semitones
+
         # Compute the pitch class of the target note
         tonic_midi = int(round(freq_to_midi(self.tonic_freq)))
         target_midi = tonic_midi + self.target_interval_semitones
         self.target_pc = target_midi % 12
 
+        if self.target_search:
+            self.estimator.set_target(self.target_pc, self.tolerance_cents,
+                                      self.octave_span, center_midi=target_midi)
+
     def _audio_callback(self, indata, frames, time_info, status):
         if status:
-            print(f"Audio input status: {status}")
+            if status.input_overflow:
+                self.overflow_count += 1
+                _overflows.inc()
+            if not self.analysis_thread:
+                print(f"Audio input status: {status}")
+
+        if self.analysis_thread:
+            self._ring.write(indata[:, 0])
+            self._data_ready.set()
+            return
+
         with self._lock:
             if self.correct_detected:
                 return
 
-        audio = indata[:, 0]
-        pitch = yin_pitch(audio, SAMPLE_RATE)
+        self._analyze(indata[:, 0])
+
+    def _window_time(self):
+        # Seconds since the listening window opened; negative inside a capture's preroll
+        return (self.samples_seen - self._preroll) / SAMPLE_RATE
+
+    def _listen_time(self):
+        # A hit or onset inside the preroll counts as the moment the listen began
+        return max(0.0, self._window_time())
+
+    def _analyze(self, block, analyze=None):
+        self.samples_seen += len(block)
+        if self.trace is not None and len(block):
+            self._rms = sqrt(float(np.dot(block, block)) / len(block))
+        if analyze is None:
+            analyze = self.gate.update(block) if self.gate is not None else True
+        if analyze and self.gate is not None and self.gate.onset:
+            self.onset_time = self._listen_time()
+        if self.decimator is not None:
+            block = self.decimator.process(block)
+        self.estimator.process(block, self._on_pitch, analyze)
+
+    def _analysis_loop(self):
+        while not self._worker_stop.is_set():
+            self._data_ready.wait(timeout=0.1)
+            self._data_ready.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        ring = self._source
+        hop = self.hop_size
+        window = self.window_size
+
+        if self.correct_detected and not self.early_exit_frames:
+            ring.skip(ring.available())
+            return
+
+        # Behind by more than a window: only the newest window still matters,
+        # so jump straight to it rather than analysing every stale hop.
+        # With a gate the stale hops are still gated (an RMS each), so the
+        # first frames of a note that started while we were behind are
+        # analysed rather than thrown away.
+        backlog = ring.available()
+        if backlog > window + hop and self.gate is None:
+            stale = backlog - window
+            ring.skip(stale)
+            self.dropped_frames += stale // hop
+            _dropped.inc(stale // hop)
+            self._reset_analysis()
+
+        while ring.available() >= hop:
+            if self.correct_detected and not self.early_exit_frames:
+                ring.skip(ring.available())  # hit mid-drain; the rest cannot change the verdict
+                break
+            ring.read(self._chunk)
+            if self.gate is None or ring.available() <= window:
+                self._analyze(self._chunk)
+                continue
+            voiced = self.gate.update(self._chunk)
+            analyze = voiced and self.gate.onset
+            if voiced and not analyze:
+                self.dropped_frames += 1
+                _dropped.inc()
+            self._analyze(self._chunk, analyze)
+        self.dropped_frames += ring.lost // hop
+        _dropped.inc(ring.lost // hop)
+        ring.lost %= hop
+
+    def _reset_analysis(self):
+        self.estimator.reset()
+        if self.decimator is not None:
+            self.decimator.reset()
+        if self.gate is not None:
+            self.gate.reset()
+
+    def _on_pitch(self, pitch):
         if pitch is None:
+            self._consecutive_hits = 0
+            if self.on_estimate is not None:
+                self.on_estimate(self._window_time(), None, None)
+            if self.trace is not None:
+                self.trace.record(self._window_time(), None, 0.0, None, self._rms)
             return
 
+        if self.onset_time is None:
+            # Without a gate the first voiced frame stands in for the onset
+            self.onset_time = self._listen_time()
         m_detected = freq_to_midi(pitch)
         tonic_midi = freq_to_midi(self.tonic_freq)
         m_target = tonic_midi + self.target_interval_semitones
+        if self.on_estimate is not None or self.trace is not None:
+            cents = cents_off_target(m_detected, m_target)
+            if self.on_estimate is not None:
+                self.on_estimate(self._window_time(), pitch, cents)
+            if self.trace is not None:
+                self.trace.record(self._window_time(), pitch, self.estimator.confidence,
+                                  cents, self._rms)
+
+        # Several hops can be analysed per drain; once the target has been
+        # hit, later frames must not overwrite the verdict.
+        if self.correct_detected and not self.early_exit_frames:
+            return
 
         cents_diff = pitch_class_difference(m_detected, m_target)
 
         detected_note = midi_to_note_name(m_detected)
         target_note = midi_to_note_name(m_target)
 
-        print(f"Detected pitch: {pitch:.2f} Hz → {detected_note}, "
-            f"Target: {target_note}, Pitch class diff: {cents_diff:.1f} cents")
+        if self.verbose:
+            print(f"Detected pitch: {pitch:.2f} Hz → {detected_note}, "
+                f"Target: {target_note}, Pitch class diff: {cents_diff:.1f} cents")
+
+        hit = abs(cents_diff) <= self.tolerance_cents
+        self._consecutive_hits = self._consecutive_hits + 1 if hit else 0
 
         with self._lock:
-            self.last_detected_note = detected_note
-            self.correct_detected = abs(cents_diff) <= self.tolerance_cents
+            if not self.correct_detected:
+                self.last_detected_note = detected_note
+                self.correct_detected = hit
+                if hit:
+                    self.hit_time = self._listen_time()
+                    _onset_to_verdict.observe(self.hit_time - self.onset_time)
 
-    def start_listening(self, duration_sec=5):
+        if self.early_exit_frames and self._consecutive_hits >= self.early_exit_frames:
+            self.exited_early = True
+            self.stop_event.set()
+
+    def analyze_signal(self, signal, block_size=None):
+        """
+        Scores a whole recording offline through the same gate, decimator,
+        estimator and hit logic as live input. signal is a 1-D array (any
+        float or int16 array, e.g. a memory-mapped WAV); it is converted a
+        block at a time. Returns (correct_detected, last_detected_note).
+        """
+        self._begin_listening()
+        block_size = block_size or self.hop_size
+        block = np.empty(block_size, dtype=np.float32)
+        scale = 1 / 32768.0 if signal.dtype == np.int16 else 1.0
+        for start in range(0, len(signal), block_size):
+            chunk = signal[start:start + block_size]
+            out = block[:len(chunk)]
+            np.multiply(chunk, scale, out=out, casting='unsafe')
+            self._analyze(out)
+            if self.early_exit_frames and self.exited_early:
+                break
+        with self._lock:
+            return self.correct_detected, self.last_detected_note
+
+    def _begin_listening(self):
         with self._lock:
             self.correct_detected = False
             self.last_detected_note = None
+            self.hit_time = None
+            self.onset_time = None
+            self.exited_early = False
+            self._consecutive_hits = 0
             self.stop_event.clear()
+        self.samples_seen = 0
+        self._preroll = 0
+        self._reset_analysis()
 
-        with sd.InputStream(device=sd.default.device,
-                            channels=1,
-                            samplerate=SAMPLE_RATE,
-                            blocksize=int(FRAME_DURATION * SAMPLE_RATE),
-                            callback=self._audio_callback):
-            time.sleep(duration_sec)
+    def start_listening(self, duration_sec=5):
+        self._begin_listening()
+
+        if self.capture is not None:
+            self._listen_on_capture(duration_sec)
+            self.stop_event.set()
+            return
+
+        self._ring.reset()
+        self._source = self._ring
+
+        worker = None
+        if self.analysis_thread:
+            self._worker_stop.clear()
+            worker = threading.Thread(target=self._analysis_loop, daemon=True)
+            worker.start()
+
+        try:
+            with self.backend.input_stream(SAMPLE_RATE, self.hop_size, self._audio_callback) as stream:
+                # Stream time rather than wall time, so a file played faster
+                # than real time still gets a full window
+                stream.wait(duration_sec, self.stop_event)
+        finally:
+            if worker is not None:
+                self._worker_stop.set()
+                self._data_ready.set()
+                worker.join()
         self.stop_event.set()
 
+    def _listen_on_capture(self, duration_sec):
+        # The capture callback already runs off this thread, so the listening
+        # thread drains its subscription directly instead of sleeping.
+        sub = self.capture.subscribe(duration_sec, self._data_ready, granularity=self.hop_size)
+        self._source = sub
+        self._preroll = sub.preroll
+        try:
+            while not sub.finished() and not self.stop_event.is_set() and self.capture.is_running():
+                self.clock.wait(self._data_ready, 0.1)
+                self._data_ready.clear()
+                self._drain()
+        finally:
+            self.capture.unsubscribe(sub)
+
     def wait_for_detection(self, timeout=None):
         self.stop_event.wait(timeout)
         with self._lock:
@@ -149,4 +374,177 @@ class PitchDetector:
         return self.wait_for_detection(timeout=timeout)
 
     def stop(self):
-        self.stop_event.set()
\ No newline at end of file
+        self.stop_event.set()
+
+class EnsembleDetector:
+    """
+    Several players answering the same prompt at once, one per input
+    channel of a single stream. The audio callback only copies
+    (frames, channels) blocks into a ring; the listening thread drains it
+    a hop at a time through one BatchYinEstimator and keeps a verdict per
+    channel with array operations, so adding a player adds a row to each
+    array rather than another estimator call. Given a CaptureService
+    opened with the same number of channels, it listens on that
+    session-long stream instead of opening one per listen. With
+    stop_when_all_correct the listen ends once every channel has been on
+    target for confirm_frames consecutive frames.
+    """
+
+    def __init__(self, tonic_freq, target_interval_semitones, channels, tolerance_cents=50, hop_size=None,
+                 max_freq=1000, backend=None, device=None, stop_when_all_correct=False, verbose=True,
+                 capture=None, clock=None, confirm_frames=1):
+        if capture is not None and capture.channels != channels:
+            raise ValueError(f"capture has {capture.channels} channels, expected {channels}")
+        self.channels = channels
+        self.capture = capture
+        self.clock = clock or real_clock
+        self.tolerance_cents = tolerance_cents
+        self.hop_size = hop_size or int(HOP_DURATION * SAMPLE_RATE)
+        self.backend = backend or LiveBackend()
+        self.device = device
+        self.stop_when_all_correct = stop_when_all_correct
+        self.confirm_frames = confirm_frames
+        self.verbose = verbose
+        self.stop_event = threading.Event()
+        self.overflow_count = 0
+        self.dropped_frames = 0
+        self.samples_seen = 0
+        self.exited_early = False
+
+        self.estimator = BatchYinEstimator(channels, hop_size=self.hop_size, max_freq=max_freq)
+        self._ring = SampleRing(int(RING_DURATION * SAMPLE_RATE), channels=channels)
+        self._source = self._ring
+        self._preroll = 0
+        self._end = 0
+        self._chunk = np.empty((self.hop_size, channels), dtype=np.float32)
+        self._data_ready = threading.Event()
+
+        # Per-channel verdicts: hit flag, seconds into the listen of the
+        # hit, and the last pitch heard (as MIDI) before it
+        self.correct = np.zeros(channels, dtype=bool)
+        self.hit_times = np.full(channels, np.nan)
+        self._last_midi = np.full(channels, np.nan)
+        self._consecutive_hits = np.zeros(channels, dtype=np.intp)
+        self._confirmed = np.zeros(channels, dtype=bool)
+        self._midi = np.empty(channels)
+        self._voiced = np.empty(channels, dtype=bool)
+        self.set_target(tonic_freq, target_interval_semitones)
+
+    def set_target(self, tonic_freq, target_interval_semitones):
+        self.tonic_freq = tonic_freq
+        self.target_interval_semitones = target_interval_semitones
+        self.target_midi = int(round(freq_to_midi(tonic_freq))) + target_interval_semitones
+
+    def _audio_callback(self, indata, frames, time_info, status):
+        if status and status.input_overflow:
+            self.overflow_count += 1
+            _overflows.inc()
+        self._ring.write(indata)
+        self._data_ready.set()
+
+    def _on_pitches(self, pitches):
+        np.isfinite(pitches, out=self._voiced)
+        if not self._voiced.any():
+            self._consecutive_hits.fill(0)
+            return
+        midi = self._midi
+        np.divide(pitches, 440.0, out=midi)
+        np.log2(midi, out=midi, where=self._voiced)
+        midi *= 12
+        midi += 69
+
+        # Same pitch class test as pitch_class_difference, for every channel at once
+        diff = (np.rint(midi) - self.target_midi) % 12
+        diff = np.where(diff > 6, diff - 12, diff) * 100
+        hit = self._voiced & (np.abs(diff) <= self.tolerance_cents)
+        self._consecutive_hits += 1
+        self._consecutive_hits[~hit] = 0
+        self._confirmed |= self._consecutive_hits >= self.confirm_frames
+        if self.stop_when_all_correct and self._confirmed.all():
+            self.exited_early = True
+            self.stop_event.set()
+        listening = ~self.correct
+        new_hits = hit & listening
+        update = self._voiced & listening
+        self._last_midi[update] = midi[update]
+        if not new_hits.any():
+            return
+        # Seconds from the window opening; a hit inside the preroll counts as immediate
+        self.hit_times[new_hits] = max(0, self.samples_seen - self._preroll) / SAMPLE_RATE
+        self.correct |= new_hits
+        if self.verbose:
+            for channel in np.flatnonzero(new_hits):
+                print(f"Channel {channel + 1}: {midi_to_note_name(midi[channel])} on target "
+                      f"after {self.hit_times[channel]:.2f} s")
+
+    def _drain(self):
+        ring = self._source
+        hop = self.hop_size
+        # Bounded by the window end, or an unpaced producer would keep this loop going forever
+        while self.samples_seen < self._end and ring.available() >= hop and not self.stop_event.is_set():
+            ring.read(self._chunk)
+            # Audio the ring overwrote before it was read still counts as stream time
+            self.samples_seen += hop + ring.lost
+            self.dropped_frames += ring.lost // hop
+            _dropped.inc(ring.lost // hop)
+            ring.lost = 0
+            self.estimator.process(self._chunk, self._on_pitches)
+
+    def _begin_listening(self):
+        self.stop_event.clear()
+        self.correct.fill(False)
+        self.hit_times.fill(np.nan)
+        self._last_midi.fill(np.nan)
+        self._consecutive_hits.fill(0)
+        self._confirmed.fill(False)
+        self.samples_seen = 0
+        self.exited_early = False
+        self._preroll = 0
+        self._end = 0
+        self._ring.reset()
+        self.estimator.reset()
+
+    def start_listening(self, duration_sec=5):
+        """Listens on every channel for duration_sec of audio, draining on the calling thread."""
+        self._begin_listening()
+        if self.capture is not None:
+            self._listen_on_capture(duration_sec)
+            self.stop_event.set()
+            return
+
+        self._source = self._ring
+        self._end = end = int(duration_sec * SAMPLE_RATE)
+        with self.backend.input_stream(SAMPLE_RATE, self.hop_size, self._audio_callback, device=self.device,
+                                       channels=self.channels) as stream:
+            while self.samples_seen < end and not self.stop_event.is_set():
+                self.clock.wait(self._data_ready, 0.1)
+                self._data_ready.clear()
+                self._drain()
+                if not stream.active and self._ring.available() < self.hop_size:
+                    break  # a file or script ran out
+        self.stop_event.set()
+
+    def _listen_on_capture(self, duration_sec):
+        sub = self.capture.subscribe(duration_sec, self._data_ready, granularity=self.hop_size)
+        self._source = sub
+        self._preroll = sub.preroll
+        self._end = sub.end - sub.start
+        try:
+            while not sub.finished() and not self.stop_event.is_set() and self.capture.is_running():
+                self.clock.wait(self._data_ready, 0.1)
+                self._data_ready.clear()
+                self._drain()
+        finally:
+            self.capture.unsubscribe(sub)
+
+    def results(self):
+        """[(correct, note)] per channel; note is the pitch that hit the target, else the last one heard."""
+        return [(bool(hit), None if np.isnan(midi) else midi_to_note_name(midi))
+                for hit, midi in zip(self.correct, self._last_midi)]
+
+    def detect_pitch_within_bar(self, duration_sec=3):
+        self.start_listening(duration_sec=duration_sec)
+        return self.results()
+
+    def stop(self):
+        self.stop_event.set()
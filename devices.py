@@ -0,0 +1,37 @@
+#devices.py
+
+import threading
+
+import sounddevice as sd
+
+_lock = threading.Lock()
+_selected = None
+_inputs = None
+
+
+def configure_devices():
+    """
+    Prefers a built-in microphone as the default input. Enumerating devices
+    can take a noticeable time on machines with many interfaces, so it runs
+    once per process (normally in the background at startup) and later
+    calls return the cached choice.
+    """
+    global _selected
+    with _lock:
+        if _selected is None:
+            devices = sd.query_devices()
+            internal_mic = [i for i, d in enumerate(devices) if "Microphone" in d['name']]
+            if internal_mic:
+                sd.default.device = (internal_mic[0], 1)
+            _selected = sd.default.device
+        return _selected
+
+
+def input_devices():
+    """[(index, name, input channels)] for every device that can record, queried once."""
+    global _inputs
+    with _lock:
+        if _inputs is None:
+            _inputs = [(i, d['name'], d['max_input_channels'])
+                       for i, d in enumerate(sd.query_devices()) if d['max_input_channels'] > 0]
+        return _inputs
@@ -0,0 +1,109 @@
+#gate.py
+
+import numpy as np
+
+from telemetry import telemetry
+
+OPEN_DB = -45.0       # RMS level (dBFS) that opens the gate
+CLOSE_DB = -52.0      # level it must fall below to close again
+HOLD_FRAMES = 3       # quiet frames before the gate actually closes
+FLUX_THRESHOLD = 0.3  # normalised spectral flux that counts as a new onset
+
+_analysed = telemetry.counter("gate_frames_analysed_total", "Frames the gate passed on to the pitch estimator")
+_skipped = telemetry.counter("gate_frames_skipped_total", "Frames the gate skipped as silent")
+_onsets = telemetry.counter("gate_onsets_total", "Note onsets the gate detected")
+
+
+class SignalGate:
+    """
+    Cheap voiced/silent gate placed in front of a pitch estimator.
+
+    Every frame costs one dot product for the RMS. Only frames loud enough
+    to matter also get a small FFT for spectral flux, which flags note
+    onsets (a new attack while the gate is already open, or the gate
+    opening). Hysteresis and a hold time stop it chattering on decays.
+    """
+
+    __slots__ = ('frame_size', 'open_level', 'close_level', 'hold_frames', 'flux_threshold',
+                 'is_open', 'onset', 'hits', 'misses', 'onsets',
+                 '_quiet', '_window', '_padded', '_spectrum', '_mag', '_prev_mag', '_diff')
+
+    def __init__(self, frame_size, open_db=OPEN_DB, close_db=CLOSE_DB, hold_frames=HOLD_FRAMES,
+                 flux_threshold=FLUX_THRESHOLD):
+        self.frame_size = frame_size
+        # Compare mean squares rather than dB so no log is taken per frame
+        self.open_level = 10 ** (open_db / 10)
+        self.close_level = 10 ** (close_db / 10)
+        self.hold_frames = hold_frames
+        self.flux_threshold = flux_threshold
+
+        self.is_open = False
+        self.onset = False
+        self.hits = 0     # frames passed on to the estimator
+        self.misses = 0   # frames skipped as silent
+        self.onsets = 0
+        self._quiet = 0
+
+        fft_size = 1 << int(frame_size - 1).bit_length()
+        self._window = np.hanning(frame_size).astype(np.float32)
+        self._padded = np.zeros(fft_size, dtype=np.float32)
+        self._spectrum = np.empty(fft_size // 2 + 1, dtype=np.complex64)
+        self._mag = np.zeros(fft_size // 2 + 1, dtype=np.float32)
+        self._prev_mag = np.zeros_like(self._mag)
+        self._diff = np.empty_like(self._mag)
+
+    def reset(self):
+        self.is_open = False
+        self.onset = False
+        self._quiet = 0
+        self._prev_mag[:] = 0
+
+    def update(self, frame):
+        """Returns True if this frame should be analysed. Sets self.onset on note attacks."""
+        n = len(frame)
+        if n == 0:
+            return self.is_open
+        mean_square = float(np.dot(frame, frame)) / n
+
+        was_open = self.is_open
+        if mean_square >= self.open_level:
+            self.is_open = True
+            self._quiet = 0
+        elif mean_square < self.close_level and self.is_open:
+            self._quiet += 1
+            if self._quiet >= self.hold_frames:
+                self.is_open = False
+
+        if not self.is_open:
+            self.onset = False
+            self.misses += 1
+            _skipped.inc()
+            if was_open:
+                self._prev_mag[:] = 0
+            return False
+
+        flux = self._flux(frame)
+        self.onset = not was_open or flux > self.flux_threshold
+        self.onsets += self.onset
+        self.hits += 1
+        _onsets.inc(self.onset)
+        _analysed.inc()
+        return True
+
+    def _flux(self, frame):
+        size = min(len(frame), self.frame_size)
+        np.multiply(frame[-size:], self._window[:size], out=self._padded[:size])
+        self._padded[size:] = 0
+        np.fft.rfft(self._padded, out=self._spectrum)
+        np.abs(self._spectrum, out=self._mag)
+        np.subtract(self._mag, self._prev_mag, out=self._diff)
+        np.maximum(self._diff, 0, out=self._diff)
+        total = float(self._mag.sum())
+        self._prev_mag, self._mag = self._mag, self._prev_mag
+        return float(self._diff.sum()) / total if total > 0 else 0.0
+
+    def report(self):
+        total = self.hits + self.misses
+        skipped = 100.0 * self.misses / total if total else 0.0
+        return (f"Gate: {self.hits} analysed, {self.misses} skipped ({skipped:.1f}% of frames), "
+                f"{self.onsets} onsets")
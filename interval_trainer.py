@@ -5,13 +5,17 @@ import random
 import threading
 import time
 import pygame
-import io
-import wave
-import numpy as np
-import queue
 
 from metronome import Metronome
-from detect_pitch import PitchDetector
+from scheduler import BeatScheduler
+from detect_pitch import PitchDetector, EnsembleDetector
+from capture import CaptureService
+from tone_cache import get_tone
+from assets import assets
+from clock import real_clock
+from pitch_trace import TraceRecorder
+from telemetry import telemetry, SamplingProfiler
+from tone_pipeline import TonePipeline, LOOKAHEAD_TRIALS, note_frequency
 
 # Constants
 ALL_INTERVALS = [
@@ -23,33 +27,35 @@ ALL_INTERVALS = [
 
 BEATS_PER_BAR = 4
 DEFAULT_BPM = 60
+FAST_CONFIRM_FRAMES = 3  # consecutive on-target frames that end a FAST-mode answer
 SAMPLE_RATE = 44100
 
+_play_delay = telemetry.histogram("tone_play_delay_seconds", "Delay from a beat to its reference tone starting")
+_trial_time = telemetry.histogram("trial_wall_seconds", "Wall time per trial, from its prompt to its reference")
+_trials = telemetry.counter("trials_total", "Trials answered")
+_trials_correct = telemetry.counter("trials_correct_total", "Trials answered correctly")
 
-def generate_sine_wave_wav(frequency, duration_ms, volume=0.1):
-    duration = duration_ms / 1000.0
-    t = np.linspace(0, duration, int(SAMPLE_RATE * duration), False)
-    wave_data = (np.sin(2 * np.pi * frequency * t) * (volume * 32767)).astype(np.int16)
-
-    buffer = io.BytesIO()
-    with wave.open(buffer, 'wb') as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(SAMPLE_RATE)
-        wf.writeframes(wave_data.tobytes())
-    buffer.seek(0)
-    return pygame.mixer.Sound(buffer)
 
-
-def note_frequency(tonic_freq, semitones):
-    return tonic_freq * (2 ** (semitones / 12))
+def generate_sine_wave_wav(frequency, duration_ms, volume=0.1):
+    # Shared across sessions; see tone_cache.ToneCache
+    return get_tone(frequency, duration_ms, volume, SAMPLE_RATE)
 
 
 class IntervalTrainer:
     def __init__(self, bpm, tonic_freq, repeats, status_label, start_button, stop_button,
-                 feedback_mode="SLOW", intervals=None):
+                 feedback_mode="SLOW", intervals=None, fast_confirm_frames=FAST_CONFIRM_FRAMES,
+                 target_search=False, random_tonic=False, tonic_octaves=1, lookahead=LOOKAHEAD_TRIALS,
+                 clock=None, answer_script=None, trace_path=None, results=None,
+                 telemetry_path=None, profile_path=None, channels=1, device=None, backend=None):
         self.bpm = bpm
         self.tonic_freq = tonic_freq
+        # With random_tonic every trial picks its own tonic within
+        # tonic_octaves octaves centred on tonic_freq; its tones are then
+        # rendered lookahead trials ahead instead of all up front.
+        self.random_tonic = random_tonic
+        self.tonic_octaves = tonic_octaves
+        self.lookahead = lookahead
+        self.tone_pipeline = None
         self.repeats = repeats
         self.status_label = status_label
         self.start_button = start_button
@@ -57,98 +63,191 @@ class IntervalTrainer:
         self.feedback_mode = feedback_mode.upper()
         self.intervals = intervals if intervals else ALL_INTERVALS
 
-        self.metronome = Metronome(bpm=bpm, beats_per_bar=BEATS_PER_BAR)
-        self.current_beat = {'beat': 0, 'bar': 0}
-        self.beat_condition = threading.Condition()
+        # With a clock.VirtualClock and an answer_script(name, semitones,
+        # tonic_freq) -> (correct, note, seconds_to_answer) standing in for
+        # the microphone, a whole session runs in milliseconds; see
+        # training_loop(), which can then be called directly. backend
+        # replaces the sound card for the metronome and the capture (see
+        # audio_backend); a simulated one given the same virtual clock
+        # runs the real detection path on scripted audio just as fast.
+        self.clock = clock or real_clock
+        if backend is not None and not backend.realtime and not self.clock.virtual:
+            # Nothing would pace the metronome's output stream: it would race
+            # through beats and the listen windows would not line up with bars
+            raise ValueError("a backend with realtime=False needs a VirtualClock")
+        self.answer_script = answer_script
+        self.trials_run = 0
+        self.trials_correct = 0
+        self._trial_time_total = 0.0
+        # Optional results_store.ResultsStore; every trial is queued to it
+        # and written in the background
+        self.results = results
+        self.answer_latency = None
+        # telemetry_path gets a dump of every counter and histogram at the
+        # end of the session (JSON, or Prometheus text for .prom). With
+        # profile_path the training and scheduler threads are stack-sampled
+        # for the session and written there as collapsed stacks.
+        self.telemetry_path = telemetry_path
+        self.profile_path = profile_path
+
+        self.metronome = Metronome(bpm=bpm, beats_per_bar=BEATS_PER_BAR, backend=backend, clock=self.clock)
         self.stop_event = threading.Event()
 
-        self.metronome.register_callback(self.on_beat)
+        # Playback, prompts and status updates are queued on one scheduler
+        # thread keyed to (bar, beat) rather than each getting its own thread
+        self.scheduler = BeatScheduler(BEATS_PER_BAR, clock=self.clock)
+        self.metronome.register_callback(self.scheduler.on_beat)
+        self.metronome.register_error_callback(self.scheduler.fail)
+
+        # One input stream for the whole session; each trial subscribes to
+        # it. device is a sounddevice input (index or name), None for the
+        # default; an ensemble needs one with at least channels inputs.
+        self.capture = CaptureService(device=device, channels=channels, backend=backend)
+        # FAST mode ends the answer window as soon as the target is confirmed;
+        # SLOW keeps listening for the whole bar.
+        early_exit = fast_confirm_frames if self.feedback_mode == "FAST" else None
+        # With trace_path every estimate of the session is appended to a
+        # binary pitch trace, tagged with its trial; see pitch_trace.read_trace
+        self.trace = TraceRecorder(trace_path) if trace_path else None
+        self.detector = PitchDetector(tonic_freq=self.tonic_freq, target_interval_semitones=0,
+                                      capture=self.capture, early_exit_frames=early_exit,
+                                      target_search=target_search, trace=self.trace, clock=self.clock)
+        # With channels > 1 each input channel is a player answering the same
+        # prompt; one EnsembleDetector listens to all of them on the shared
+        # capture, and a trial is correct only when every channel is. FAST
+        # mode ends the window once each has held it for fast_confirm_frames frames.
+        self.ensemble = None
+        self.channel_results = []
+        self.channel_scores = [0] * channels
+        if channels > 1:
+            self.ensemble = EnsembleDetector(self.tonic_freq, 0, channels, capture=self.capture, clock=self.clock,
+                                             stop_when_all_correct=self.feedback_mode == "FAST",
+                                             confirm_frames=fast_confirm_frames)
 
         self.interval_channel = pygame.mixer.Channel(1)
         self.feedback_channel = pygame.mixer.Channel(2)
         self.name_channel = pygame.mixer.Channel(3)
 
-        self.feedback_sounds = {
-            "correct": pygame.mixer.Sound("sounds/correct.wav"),
-            "incorrect": pygame.mixer.Sound("sounds/incorrect.wav")
-        }
-
-        self.sound_cache = {
-            semitone: generate_sine_wave_wav(note_frequency(self.tonic_freq, semitone), duration_ms=600)
-            for _, semitone in self.intervals
-        }
-        self.tonic_sound = generate_sine_wave_wav(self.tonic_freq, duration_ms=600)
-
-        self.name_sounds = {
-            "Minor Second": pygame.mixer.Sound("sounds/minor_second.wav"),
-            "Major Second": pygame.mixer.Sound("sounds/major_second.wav"),
-            "Minor Third": pygame.mixer.Sound("sounds/minor_third.wav"),
-            "Major Third": pygame.mixer.Sound("sounds/major_third.wav"),
-            "Perfect Fourth": pygame.mixer.Sound("sounds/perfect_fourth.wav"),
-            "Tritone": pygame.mixer.Sound("sounds/tritone.wav"),
-            "Perfect Fifth": pygame.mixer.Sound("sounds/perfect_fifth.wav"),
-            "Minor Sixth": pygame.mixer.Sound("sounds/minor_sixth.wav"),
-            "Major Sixth": pygame.mixer.Sound("sounds/major_sixth.wav"),
-            "Minor Seventh": pygame.mixer.Sound("sounds/minor_seventh.wav"),
-            "Major Seventh": pygame.mixer.Sound("sounds/major_seventh.wav"),
-            "Octave": pygame.mixer.Sound("sounds/octave.wav")
-        }
-
-    def on_beat(self, beat_num):
-        with self.beat_condition:
-            if beat_num == 1:
-                self.current_beat['bar'] += 1
-            self.current_beat['beat'] = beat_num
-            self.beat_condition.notify_all()
+        self.sound_cache = {}
+        self.tonic_sound = None
+        if not self.random_tonic:
+            self.sound_cache = {
+                semitone: generate_sine_wave_wav(note_frequency(self.tonic_freq, semitone), duration_ms=600)
+                for _, semitone in self.intervals
+            }
+            self.tonic_sound = generate_sine_wave_wav(self.tonic_freq, duration_ms=600)
+
+    def set_status(self, text):
+        self.status_label.after(0, lambda: self.status_label.config(text=text))
 
     def wait_for_bar(self, target_bar):
-        with self.beat_condition:
-            while self.current_beat['bar'] < target_bar and not self.stop_event.is_set():
-                self.beat_condition.wait()
+        return self.scheduler.wait_for(target_bar, 1)
 
     def bar_duration_sec(self):
         return (60 / self.bpm) * BEATS_PER_BAR
 
-    def wait_for_beat(self, target_beat, target_bar, timeout=None):
-        with self.beat_condition:
-            start_time = time.time()
-            while not (self.current_beat['bar'] == target_bar and self.current_beat['beat'] == target_beat):
-                if self.stop_event.is_set():
-                    break
-                remaining = None
-                if timeout is not None:
-                    elapsed = time.time() - start_time
-                    remaining = max(0, timeout - elapsed)
-                    if remaining == 0:
-                        break
-                self.beat_condition.wait(timeout=remaining)
+    def name_sound(self, name):
+        # "Perfect Fifth" -> sounds/perfect_fifth.wav, loaded once per process
+        return assets.sound(name.lower().replace(" ", "_"))
 
     def play_feedback(self, correct):
-        def feedback_worker():
-            sound_key = "correct" if correct else "incorrect"
-            self.feedback_channel.play(self.feedback_sounds[sound_key])
-            while self.feedback_channel.get_busy() and not self.stop_event.is_set():
-                time.sleep(0.01)
-
-        threading.Thread(target=feedback_worker, daemon=True).start()
-
-    def play_interval_sounds(self, semitone_interval):
-        current_bar = self.current_beat['bar']
-        current_beat = self.current_beat['beat']
-
-        self.interval_channel.play(self.tonic_sound)
-
-        def play_after_next_beat():
-            next_beat = (current_beat % BEATS_PER_BAR) + 1
-            next_bar = current_bar + (1 if next_beat == 1 else 0)
-            self.wait_for_beat(next_beat, next_bar)
-
-            while self.interval_channel.get_busy() and not self.stop_event.is_set():
-                time.sleep(0.005)
-
-            self.interval_channel.play(self.sound_cache[semitone_interval])
-
-        threading.Thread(target=play_after_next_beat, daemon=True).start()
+        sound_key = "correct" if correct else "incorrect"
+        self.feedback_channel.play(assets.sound(sound_key))
+
+    def listen(self, name, semitones, tonic_freq):
+        """Runs one answer window. Returns (correct, note, exited_early)."""
+        if self.answer_script is not None:
+            correct, note, seconds = self.answer_script(name, semitones, tonic_freq)
+            self.answer_latency = seconds if correct else None
+            bar_duration = self.bar_duration_sec()
+            early = self.feedback_mode == "FAST" and correct and seconds < bar_duration
+            # A full window ends on the bar's last sample, as a captured one
+            # does; sleeping onto the boundary would fire the next downbeat
+            # and push every later trial a bar back
+            self.clock.sleep(seconds if early else bar_duration - 1 / SAMPLE_RATE)
+            return correct, note, early
+
+        if self.ensemble is not None:
+            return self._listen_ensemble(semitones, tonic_freq)
+
+        # Listening runs right here on the training thread; it ends
+        # after one bar, or earlier in FAST mode.
+        self.detector.set_target(tonic_freq, semitones)
+        correct, note = self.detector.detect_pitch_within_bar(duration_sec=self.bar_duration_sec(),
+                                                              timeout=0)
+        self.answer_latency = self.detector.hit_time if correct else None
+        return correct, note, self.detector.exited_early
+
+    def _listen_ensemble(self, semitones, tonic_freq):
+        self.ensemble.set_target(tonic_freq, semitones)
+        bar_duration = self.bar_duration_sec()
+        self.channel_results = self.ensemble.detect_pitch_within_bar(duration_sec=bar_duration)
+        for channel, (hit, _) in enumerate(self.channel_results):
+            self.channel_scores[channel] += hit
+        correct = all(hit for hit, _ in self.channel_results)
+        note = " ".join(f"{channel + 1}:{note or '-'}{'✓' if hit else '✗'}"
+                        for channel, (hit, note) in enumerate(self.channel_results))
+        self.answer_latency = None
+        return correct, note, self.ensemble.exited_early
+
+    def record_results(self, session_id, index, name, semitones, tonic_freq, correct, note):
+        if self.ensemble is None:
+            self.results.record_trial(session_id, index, name, semitones, tonic_freq, correct, note,
+                                      self.answer_latency)
+            return
+        for channel, (hit, channel_note) in enumerate(self.channel_results):
+            latency = float(self.ensemble.hit_times[channel]) if hit else None
+            self.results.record_trial(session_id, index, name, semitones, tonic_freq, hit, channel_note,
+                                      latency, channel=channel + 1)
+
+    def pick_tonic(self):
+        if not self.random_tonic:
+            return self.tonic_freq
+        half_span = 6 * self.tonic_octaves
+        return note_frequency(self.tonic_freq, random.randint(-half_span, half_span))
+
+    def trial_tones(self, index, semitones):
+        """(tonic_sound, interval_sound) for trial index."""
+        if self.tone_pipeline is not None:
+            return self.tone_pipeline.take(index)
+        return self.tonic_sound, self.sound_cache[semitones]
+
+    def _observe_play_delay(self):
+        if self.scheduler.beat_time is not None:
+            _play_delay.observe(self.clock.now() - self.scheduler.beat_time)
+
+    def play_interval_sounds(self, tones):
+        tonic_sound, interval_sound = tones
+        self.interval_channel.play(tonic_sound)
+        self._observe_play_delay()
+        self.scheduler.at(*self.scheduler.following(), self._play_upper_note, interval_sound)
+
+    def _play_upper_note(self, sound):
+        # At fast tempos the tonic can still be sounding; queue behind it
+        # instead of polling the channel until it is free.
+        if self.interval_channel.get_busy():
+            self.interval_channel.queue(sound)
+        else:
+            self.interval_channel.play(sound)
+            self._observe_play_delay()
+
+    def _observe_trial_time(self, started):
+        elapsed = time.perf_counter() - started
+        self._trial_time_total += elapsed
+        _trial_time.observe(elapsed)
+
+    def session_summary(self):
+        parts = [f"{self.trials_correct}/{self.trials_run} correct"]
+        if self.ensemble is not None:
+            parts.append(", ".join(f"channel {channel + 1} {score}"
+                                   for channel, score in enumerate(self.channel_scores)))
+        if self.trials_run:
+            parts.append(f"{1000 * self._trial_time_total / self.trials_run:.0f} ms per trial")
+        if self.telemetry_path:
+            parts.append(f"metrics in {self.telemetry_path}")
+        if self.profile_path:
+            parts.append(f"profile in {self.profile_path}")
+        return "Session: " + "; ".join(parts)
 
     def start(self):
         self.stop_event.clear()
@@ -159,75 +258,111 @@ class IntervalTrainer:
     def stop(self):
         self.stop_event.set()
         self.metronome.stop()
-
-    def detect_pitch_async(self, tonic_freq, semitones, duration_sec, timeout):
-        result_queue = queue.Queue()
-
-        def detection_task():
-            detector = PitchDetector(tonic_freq=tonic_freq, target_interval_semitones=semitones)
-            correct, note = detector.detect_pitch_within_bar(duration_sec=duration_sec, timeout=timeout)
-            detector.stop()
-            result_queue.put((correct, note))
-
-        threading.Thread(target=detection_task, daemon=True).start()
-        return result_queue
+        self.scheduler.stop()
+        self.detector.stop()
+        if self.ensemble is not None:
+            self.ensemble.stop()
 
     def training_loop(self):
+        if self.answer_script is None:
+            self.capture.start()
+        self.scheduler.start()
         self.metronome.start()
+        profiler = None
+        if self.profile_path:
+            profiler = SamplingProfiler([threading.current_thread(), self.scheduler])
+            profiler.start()
         try:
             all_trials = []
             for _ in range(self.repeats):
-                all_trials += random.sample(self.intervals, len(self.intervals))
-
-            for name, semitones in all_trials:
+                all_trials += [(name, semitones, self.pick_tonic())
+                               for name, semitones in random.sample(self.intervals, len(self.intervals))]
+            if self.random_tonic:
+                self.tone_pipeline = TonePipeline([(tonic, semitones) for _, semitones, tonic in all_trials],
+                                                  lookahead=self.lookahead)
+            if self.results is not None:
+                session_id = self.results.start_session(self.bpm, self.tonic_freq, self.repeats,
+                                                        self.feedback_mode, self.random_tonic, self.intervals)
+
+            for index, (name, semitones, tonic_freq) in enumerate(all_trials):
                 if self.stop_event.is_set():
-                    self.status_label.after(0, lambda: self.status_label.config(text="Session stopped."))
-                    return
-
-                self.status_label.after(0, lambda: self.status_label.config(text="Get ready..."))
-                self.wait_for_bar(self.current_beat['bar'] + 1)
-
-                self.status_label.after(0, lambda n=name: self.status_label.config(text=f"Prompt: {n}"))
-                self.name_channel.play(self.name_sounds[name])
-                self.wait_for_bar(self.current_beat['bar'] + 1)  # Wait for prompt to finish
-
-                self.status_label.after(0, lambda n=name: self.status_label.config(text=f"Your turn: Play {n}"))
-
-                bar_duration = self.bar_duration_sec()
-                timeout = bar_duration + 2  # ← define the timeout variable before usage
-
-                detection_queue = self.detect_pitch_async(
-                    tonic_freq=self.tonic_freq,
-                    semitones=semitones,
-                    duration_sec=bar_duration,
-                    timeout=timeout  # use the defined variable here
-                )
-
-                try:
-                    result = detection_queue.get(timeout=timeout)  # use it here as well
-                except queue.Empty:
-                    result = None
-
-                if result is None:
-                    correct = False
-                    note = "None"
-                else:
-                    correct, note = result
-                    print(f"[DEBUG] From result queue → correct: {correct}, note: {note}")
-
+                    break
+                trial_started = time.perf_counter()
+                # Rendered while earlier trials ran; taking them also queues
+                # the next lookahead trials for rendering
+                tones = self.trial_tones(index, semitones)
+
+                self.set_status("Get ready...")
+                prompt_bar = self.scheduler.position[0] + 1
+                self.scheduler.at(prompt_bar, 1, self.set_status, f"Prompt: {name}")
+                self.scheduler.at(prompt_bar, 1, self.name_channel.play, self.name_sound(name))
+                if self.random_tonic:
+                    # The tonic changes every trial, so sound it before the answer bar
+                    self.scheduler.at(prompt_bar, BEATS_PER_BAR, self.interval_channel.play, tones[0])
+                self.scheduler.at(prompt_bar + 1, 1, self.set_status, f"Your turn: Play {name}")
+                if not self.wait_for_bar(prompt_bar + 1):  # Wait for prompt to finish
+                    break
 
-                self.status_label.after(0, lambda: self.status_label.config(
-                    text=f"Detected: {note if note else 'None'} → {'Correct' if correct else 'Incorrect'}"
-                ))
+                if self.trace is not None:
+                    self.trace.trial = index
+                correct, note, exited_early = self.listen(name, semitones, tonic_freq)
+                if self.trace is not None:
+                    self.trace.flush()
+                print(f"[DEBUG] Detection → correct: {correct}, note: {note}")
+                self.trials_run += 1
+                self.trials_correct += correct
+                _trials.inc()
+                _trials_correct.inc(correct)
+                if self.results is not None:
+                    self.record_results(session_id, index, name, semitones, tonic_freq, correct, note)
+
+                self.set_status(f"Detected: {note if note else 'None'} → {'Correct' if correct else 'Incorrect'}")
                 self.play_feedback(correct)
 
-                next_bar = self.current_beat['bar'] + 1
-                self.wait_for_bar(next_bar)
+                # An early FAST-mode answer leaves room in the answer bar for
+                # the reference interval, saving a whole bar per trial. It
+                # starts on the next beat, after the feedback sound, and needs
+                # two beats; too late in the bar, fall back to the next one.
+                if exited_early and self.scheduler.position[1] <= BEATS_PER_BAR - 2:
+                    reference = self.scheduler.following()
+                    self.scheduler.at(*reference, self.play_interval_sounds, tones)
+                    if index == len(all_trials) - 1:
+                        # No next trial keeps the session open; hear the upper note out
+                        upper = self.scheduler.following(*reference)
+                        if not self.scheduler.wait_for(*self.scheduler.following(*upper)):
+                            break
+                    self._observe_trial_time(trial_started)
+                    continue
+
+                next_bar = self.scheduler.position[0] + 1
+                self.scheduler.at(next_bar, 1, self.play_interval_sounds, tones)
+                if not self.wait_for_bar(next_bar):
+                    break
+                self._observe_trial_time(trial_started)
 
-                self.play_interval_sounds(semitones)
+            if self.scheduler.error is not None:
+                # The metronome died (e.g. its output stream would not open)
+                raise self.scheduler.error
+            if self.stop_event.is_set():
+                self.set_status("Session stopped.")
+                return
 
         finally:
             self.metronome.stop()
-            self.status_label.after(0, lambda: self.status_label.config(text="Session ended."))
+            self.scheduler.stop()
+            self.capture.stop()
+            if self.tone_pipeline is not None:
+                self.tone_pipeline.close()
+            if self.trace is not None:
+                self.trace.close()
+            if profiler is not None:
+                profiler.stop()
+                profiler.write(self.profile_path)
+            # Everything else (gate, estimator cost, metronome timing, caches,
+            # trace, results store) is in the telemetry registry
+            if self.telemetry_path:
+                telemetry.dump(self.telemetry_path)
+            print(self.session_summary())
+            self.set_status("Session ended.")
             self.start_button.config(state=tk.NORMAL)
             self.stop_button.config(state=tk.DISABLED)
@@ -2,10 +2,14 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox
-from interval_trainer import IntervalTrainer
-import pygame
 
-pygame.mixer.init(frequency=44100, size=-16, channels=1, buffer=512)
+import startup
+from results_store import DEFAULT_DB
+from telemetry import telemetry
+
+WARM_UP_POLL_MS = 50
+TELEMETRY_PATH = "telemetry.json"   # written at the end of each session and on SIGUSR1
+DEFAULT_DEVICE = "Default"
 
 # --- Map note names to frequencies (assume equal temperament, A4 = 440 Hz) ---
 NOTE_FREQS = {
@@ -40,16 +44,24 @@ INTERVALS = [
 ]
 
 def start_training():
+    # Imported (with numpy, pygame and sounddevice) by startup.warm_up while the window was showing
+    from interval_trainer import IntervalTrainer
+
     bpm = int(bpm_entry.get())
     note_name = note_var.get()
     tonic_freq = NOTE_FREQS[note_name]
     repeats = int(repeats_entry.get())
     mode = feedback_mode.get()
+    channels = int(channels_entry.get())
+    device = input_device_indices.get(device_var.get())
 
     selected_intervals = [(name, semitones) for name, semitones in INTERVALS if interval_vars[name].get()]
     if not selected_intervals:
         messagebox.showerror("Error", "Please select at least one interval.")
         return
+    if device is not None and channels > input_device_channels[device]:
+        messagebox.showerror("Error", f"{device_var.get()} has only {input_device_channels[device]} inputs.")
+        return
 
     trainer = IntervalTrainer(
         bpm=bpm,
@@ -59,7 +71,12 @@ def start_training():
         start_button=start_button,
         stop_button=stop_button,
         feedback_mode=mode,
-        intervals=selected_intervals
+        intervals=selected_intervals,
+        random_tonic=random_tonic_var.get(),
+        results=startup.results,
+        telemetry_path=TELEMETRY_PATH,
+        channels=channels,
+        device=device
     )
     trainer.start()
     window.trainer = trainer  # hold reference
@@ -71,6 +88,8 @@ def stop_training():
 window = tk.Tk()
 window.title("Interval Trainer")
 
+telemetry.dump_on_signal(TELEMETRY_PATH)
+
 # --- BPM Entry ---
 ttk.Label(window, text="BPM:").grid(row=0, column=0, sticky="e", padx=5, pady=5)
 bpm_entry = ttk.Entry(window)
@@ -95,24 +114,68 @@ feedback_mode = tk.StringVar(value="SLOW")
 mode_dropdown = ttk.Combobox(window, textvariable=feedback_mode, values=["SLOW", "FAST"], state="readonly", width=10)
 mode_dropdown.grid(row=3, column=1, padx=5, pady=5)
 
+# --- Random Tonic ---
+random_tonic_var = tk.BooleanVar(value=False)
+ttk.Checkbutton(window, text="New tonic every trial", variable=random_tonic_var).grid(row=4, column=1, sticky="w", padx=5, pady=5)
+
+# --- Players: one per input channel, all answering the same prompt ---
+ttk.Label(window, text="Players (input channels):").grid(row=5, column=0, sticky="e", padx=5, pady=5)
+channels_entry = ttk.Entry(window)
+channels_entry.insert(0, "1")
+channels_entry.grid(row=5, column=1, padx=5, pady=5)
+
+# --- Input Device: filled in once warm-up has listed the devices ---
+ttk.Label(window, text="Input device:").grid(row=6, column=0, sticky="e", padx=5, pady=5)
+device_var = tk.StringVar(value=DEFAULT_DEVICE)
+device_dropdown = ttk.Combobox(window, textvariable=device_var, values=[DEFAULT_DEVICE], state="readonly", width=30)
+device_dropdown.grid(row=6, column=1, padx=5, pady=5)
+input_device_indices = {}    # dropdown label -> sounddevice index
+input_device_channels = {}   # sounddevice index -> input channels
+
 # --- Interval Selection Checkboxes ---
 interval_vars = {name: tk.BooleanVar(value=True) for name, _ in INTERVALS}
 interval_frame = ttk.LabelFrame(window, text="Select Intervals")
-interval_frame.grid(row=0, column=2, rowspan=5, padx=10, pady=5, sticky="nsew")
+interval_frame.grid(row=0, column=2, rowspan=7, padx=10, pady=5, sticky="nsew")
 
 for i, name in enumerate(interval_vars):
     cb = ttk.Checkbutton(interval_frame, text=name, variable=interval_vars[name])
     cb.grid(row=i, column=0, sticky="w")
 
 # --- Buttons ---
-start_button = ttk.Button(window, text="Start", command=start_training)
-start_button.grid(row=5, column=0, padx=5, pady=10)
+start_button = ttk.Button(window, text="Start", command=start_training, state=tk.DISABLED)
+start_button.grid(row=7, column=0, padx=5, pady=10)
 
 stop_button = ttk.Button(window, text="Stop", command=stop_training, state=tk.DISABLED)
-stop_button.grid(row=5, column=1, padx=5, pady=10)
+stop_button.grid(row=7, column=1, padx=5, pady=10)
 
 # --- Status Label ---
-status_label = ttk.Label(window, text="Idle", anchor="center")
-status_label.grid(row=6, column=0, columnspan=3, pady=10)
+status_label = ttk.Label(window, text="Loading audio...", anchor="center")
+status_label.grid(row=8, column=0, columnspan=3, pady=10)
 
-window.mainloop()
\ No newline at end of file
+def check_warm_up():
+    if not startup.ready.is_set():
+        window.after(WARM_UP_POLL_MS, check_warm_up)
+        return
+    print(startup.report())
+    if startup.error is not None:
+        status_label.config(text=f"Audio unavailable: {startup.error}")
+        return
+    import devices
+    for index, name, inputs in devices.input_devices():
+        label = f"{index}: {name} ({inputs} in)"
+        input_device_indices[label] = index
+        input_device_channels[index] = inputs
+    device_dropdown.config(values=[DEFAULT_DEVICE, *input_device_indices])
+    status_label.config(text="Idle")
+    start_button.config(state=tk.NORMAL)
+
+# Show the window first; audio setup finishes in the background
+window.update_idletasks()
+startup.mark("window shown")
+# Trial history for every session, opened by the warm-up and written in the background
+startup.start_warm_up(results_path=DEFAULT_DB)
+window.after(WARM_UP_POLL_MS, check_warm_up)
+
+window.mainloop()
+if startup.results is not None:
+    startup.results.close()
\ No newline at end of file
@@ -1,21 +1,71 @@
 #metronome.py
 
-import pygame
-import time
+import queue
 import threading
 
+from assets import assets
+from audio_backend import LiveBackend
+from clock import real_clock
+from telemetry import telemetry
+
+SAMPLE_RATE = 44100
+BLOCK_SIZE = 256        # output block; a click can start on any sample inside it
+CLICK_GAIN = 1.0
+
+_underflows = telemetry.counter("audio_output_underflows_total", "Metronome output blocks the device ran dry on")
+_beat_late = telemetry.histogram("metronome_beat_late_seconds",
+                                 "Beat callbacks fired after the click was heard, on the audio clock")
+_drift = telemetry.histogram("metronome_drift_seconds", "Distance of each beat from the nominal grid, either way")
+
+
 class Metronome(threading.Thread):
-    def __init__(self, bpm, beats_per_bar=4):
+    """
+    Clicks are mixed straight into an output stream at the sample where each
+    beat falls, so the grid is exact to one sample and never slips when the
+    Python side is slow. The audio callback only mixes and posts beat
+    timestamps (on the stream's DAC clock); this thread then fires the
+    registered callbacks at those times, so a slow subscriber cannot delay a
+    click.
+
+    With a VirtualClock there is no stream or thread at all: each beat is a
+    timer on the clock and fires whenever a waiter advances it past that
+    beat.
+    """
+
+    def __init__(self, bpm, beats_per_bar=4, samplerate=SAMPLE_RATE, blocksize=BLOCK_SIZE, device=None,
+                 backend=None, clock=None):
         super().__init__(daemon=True)  # Daemon thread so it doesn't block program exit
         self.bpm = bpm
         self.beats_per_bar = beats_per_bar
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.device = device
+        self.backend = backend or LiveBackend()
+        self.clock = clock or real_clock
         self.callbacks = []
+        self.error_callbacks = []
+        self.error = None       # what stopped run(), if the output stream failed
 
-        # Load metronome sounds once, assuming pygame.
-        #  already initialized
-        self.high = pygame.mixer.Sound("sounds/click_high.wav")
-        self.low = pygame.mixer.Sound("sounds/click_low.wav")
-        self.metronome_channel = pygame.mixer.Channel(0)
+        # Shared by every metronome in the process; loaded on first use
+        self.high = assets.clip("click_high") * CLICK_GAIN
+        self.low = assets.clip("click_low") * CLICK_GAIN
+
+        self._position = 0      # output samples rendered so far
+        self._next_beat = 0     # index of the next beat to start
+        self._voices = []       # (start_sample, click) still sounding
+        self._beats = queue.Queue()
+        self._stream = None
+
+        # Timing statistics, all in seconds on the audio clock
+        self.underflows = 0
+        self.beats_fired = 0
+        self.first_beat_time = None
+        self.last_beat_time = None
+        self.drift = 0.0        # audio-clock beat time minus the nominal grid
+        self.max_drift = 0.0
+        self._late_sum = 0.0    # callback lateness relative to the beat time
+        self._late_sq = 0.0
+        self.max_late = 0.0
 
         # This event is internal; do not call stop() externally if you want infinite run
         self._stop_event = threading.Event()
@@ -23,37 +73,126 @@ class Metronome(threading.Thread):
     def register_callback(self, callback):
         self.callbacks.append(callback)
 
+    def register_error_callback(self, callback):
+        # callback(error) runs on this thread if the output stream fails
+        self.error_callbacks.append(callback)
+
+    def beat_sample(self, index):
+        # Integer arithmetic keeps beat k on the same sample however long the session runs
+        return index * self.samplerate * 60 // self.bpm
+
+    def beat_number(self, index):
+        return index % self.beats_per_bar + 1
+
+    def _audio_callback(self, outdata, frames, time_info, status):
+        if status and status.output_underflow:
+            self.underflows += 1
+            _underflows.inc()
+        out = outdata[:, 0]
+        out.fill(0)
+        start = self._position
+        end = start + frames
+        # Some host APIs leave the DAC time at zero; fall back to the stream clock
+        dac_time = time_info.outputBufferDacTime or time_info.currentTime
+
+        while self.beat_sample(self._next_beat) < end:
+            index = self._next_beat
+            at = self.beat_sample(index)
+            click = self.high if self.beat_number(index) == 1 else self.low
+            self._voices.append((at, click))
+            self._beats.put((index, dac_time + (at - start) / self.samplerate))
+            self._next_beat += 1
+
+        still_sounding = []
+        for at, click in self._voices:
+            lo = max(at, start)
+            hi = min(at + len(click), end)
+            out[lo - start:hi - start] += click[lo - at:hi - at]
+            if at + len(click) > end:
+                still_sounding.append((at, click))
+        self._voices = still_sounding
+        self._position = end
+
+    def start(self):
+        if not self.clock.virtual:
+            super().start()
+            return
+        self.first_beat_time = self.clock.now()
+        self.clock.call_at(self.first_beat_time, self._virtual_beat, 0)
+
+    def _virtual_beat(self, index):
+        if self._stop_event.is_set():
+            return
+        beat_time = self.first_beat_time + self.beat_sample(index) / self.samplerate
+        self._fire(index)
+        self._record(index, beat_time, self.clock.now() - beat_time)
+        self.clock.call_at(self.first_beat_time + self.beat_sample(index + 1) / self.samplerate,
+                           self._virtual_beat, index + 1)
+
+    def _fire(self, index):
+        # Fire callbacks with current beat number
+        beat_num = self.beat_number(index)
+        for callback in self.callbacks:
+            try:
+                callback(beat_num)
+            except Exception as e:
+                print(f"Metronome callback error: {e}")
+
     def run(self):
-        beat_duration = 60.0 / self.bpm
-        next_tick = time.time()
-        beat_num = 1
-        while True:  # Runs forever unless externally stopped
-            # Fire callbacks with current beat number
-            for callback in self.callbacks:
-                try:
-                    callback(beat_num)
-                except Exception as e:
-                    print(f"Metronome callback error: {e}")
-
-            # Play appropriate click sound
-            sound = self.high if beat_num == 1 else self.low
-            self.metronome_channel.play(sound)
-
-            # Compute next tick and sleep precisely
-            next_tick += beat_duration
-            sleep_time = next_tick - time.time()
-            if sleep_time > 0:
-                time.sleep(sleep_time)
-            else:
-                # We're late; reset next_tick to now to avoid drift
-                next_tick = time.time()
-
-            # Increment beat counter with wrap-around
-            beat_num = 1 if beat_num == self.beats_per_bar else beat_num + 1
-
-            # Optional stop check for internal usage (comment out if never want to stop)
-            if self._stop_event.is_set():
+        try:
+            self._stream = self.backend.output_stream(self.samplerate, self.blocksize, self._audio_callback,
+                                                      device=self.device, latency='low')
+            try:
+                self._stream.start()
+                self._run_beats()
+            finally:
+                self._stream.stop()
+                self._stream.close()
+        except Exception as e:
+            # Nothing else will ever post a beat; whoever waits on one must hear about it
+            self.error = e
+            for callback in self.error_callbacks:
+                callback(e)
+
+    def _run_beats(self):
+        while not self._stop_event.is_set():
+            try:
+                index, beat_time = self._beats.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            # Beats are posted one output latency ahead; hold each until it is heard
+            wait = beat_time - self._stream.time
+            if wait > 0 and self._stop_event.wait(wait):
                 break
 
+            self._fire(index)
+            self._record(index, beat_time, self._stream.time - beat_time)
+
+    def _record(self, index, beat_time, late):
+        if self.first_beat_time is None:
+            self.first_beat_time = beat_time - self.beat_sample(index) / self.samplerate
+        self.last_beat_time = beat_time
+        self.drift = beat_time - self.first_beat_time - self.beat_sample(index) / self.samplerate
+        self.max_drift = max(self.max_drift, abs(self.drift))
+        self.beats_fired += 1
+        self._late_sum += late
+        self._late_sq += late * late
+        self.max_late = max(self.max_late, late)
+        _beat_late.observe(max(0.0, late))
+        _drift.observe(abs(self.drift))
+
+    def jitter(self):
+        """Mean and standard deviation of callback lateness, in seconds."""
+        if not self.beats_fired:
+            return 0.0, 0.0
+        mean = self._late_sum / self.beats_fired
+        return mean, max(0.0, self._late_sq / self.beats_fired - mean * mean) ** 0.5
+
+    def timing_report(self):
+        mean, std = self.jitter()
+        return (f"Metronome: {self.beats_fired} beats, callback lateness {mean * 1000:.2f} ms "
+                f"± {std * 1000:.2f} (max {self.max_late * 1000:.2f}), drift {self.drift * 1000:+.3f} ms "
+                f"(max {self.max_drift * 1000:.3f}), {self.underflows} underflows")
+
     def stop(self):
-        self._stop_event.set()
\ No newline at end of file
+        self._stop_event.set()
@@ -0,0 +1,43 @@
+#mixer.py
+
+import numpy as np
+import pygame
+
+from wav_io import resample
+
+# pygame.mixer format code -> (dtype, full scale) of its sample arrays
+FORMATS = {
+    -8: (np.int8, 127),
+    8: (np.uint8, 127),
+    -16: (np.int16, 32767),
+    16: (np.uint16, 32767),
+    32: (np.float32, 1.0),
+}
+
+
+def make_sound(samples, sample_rate):
+    """
+    pygame Sound from mono int16 samples at sample_rate, converted to the
+    rate, sample format and channel count the mixer actually opened with.
+    pygame.mixer.init lets SDL change those to suit the device, and a raw
+    Sound(buffer=...) would then play at the wrong speed and pitch.
+    """
+    init = pygame.mixer.get_init()
+    if init is None:
+        raise pygame.error("pygame.mixer is not initialised")
+    rate, fmt, channels = init
+    if fmt not in FORMATS:
+        raise pygame.error(f"Unsupported mixer sample format {fmt}")
+    dtype, scale = FORMATS[fmt]
+
+    samples = resample(np.asarray(samples, dtype=np.int16), sample_rate, rate)
+    if np.issubdtype(dtype, np.floating):
+        data = samples.astype(dtype) / 32768.0
+    else:
+        data = (samples.astype(np.int32) * scale // 32767)
+        if fmt > 0:
+            data += scale + 1  # unsigned formats are offset by half the range
+        data = data.astype(dtype)
+    if channels > 1:
+        data = np.repeat(data[:, None], channels, axis=1)
+    return pygame.sndarray.make_sound(np.ascontiguousarray(data))
@@ -0,0 +1,829 @@
+#pitch_engine.py
+
+import time
+from math import ceil, floor
+
+import numpy as np
+
+from telemetry import telemetry
+
+SAMPLE_RATE = 44100
+FRAME_DURATION = 0.03  # analysis window length
+HOP_DURATION = 0.01    # time between successive (overlapping) estimates
+RUN_LAGS = 3           # lags scored around a restricted-search crossing, for interpolation
+TARGET_OCTAVE_SPAN = 1  # restricted search: octaves either side of the target it scores
+DIRECT_SCAN_LAGS = 128  # restricted search: longest crossing whose shorter lags are scored directly
+LAG_LEAD_IN = 0.1      # restricted bands start this fraction of a period early, where dips begin
+MPM_CUTOFF = 0.9       # McLeod: first key maximum within this fraction of the highest
+MPM_CLARITY = 0.5      # McLeod: NSDF peak height below which a frame counts as unvoiced
+SILENCE_DB = -52.0     # batched YIN: channels quieter than this (dBFS RMS) are unvoiced
+
+_frame_time = telemetry.histogram("pitch_frame_seconds", "Pitch estimator time per analysed frame")
+_batch_time = telemetry.histogram("pitch_batch_seconds", "Batched estimator time per hop across all channels")
+
+
+def _difference_function(signal, max_lag):
+    # d(tau) = sum (x[j] - x[j + tau])^2, expanded into two energy terms and
+    # an autocorrelation term so the whole thing is one FFT instead of a
+    # Python loop over every lag.
+    w_len = len(signal)
+    fft_size = 1 << int(2 * w_len - 1).bit_length()
+    spectrum = np.fft.rfft(signal, fft_size)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum), fft_size)[:max_lag]
+
+    energy = np.concatenate(([0.0], np.cumsum(signal ** 2)))
+    taus = np.arange(max_lag)
+    d = energy[w_len - taus] + (energy[w_len] - energy[taus]) - 2 * acf
+    np.maximum(d, 0, out=d)  # FFT round-off can dip just below zero
+    return d
+
+
+def _cmnd(d):
+    # Cumulative mean normalized difference, d'(tau) = d(tau) * tau / sum(d[1..tau])
+    d_prime = np.ones_like(d)
+    cumulative_sum = np.cumsum(d[1:])
+    taus = np.arange(1, len(d))
+    np.divide(d[1:] * taus, cumulative_sum, out=d_prime[1:], where=cumulative_sum != 0)
+    return d_prime
+
+
+def _pick_period(d_prime, threshold):
+    candidates = np.flatnonzero(d_prime < threshold)
+    if len(candidates) == 0:
+        return None  # no pitch found below threshold
+
+    tau = candidates[0]
+
+    # Parabolic interpolation for better precision
+    if tau + 1 < len(d_prime) and tau - 1 >= 0:
+        y0, y1, y2 = d_prime[tau - 1], d_prime[tau], d_prime[tau + 1]
+        denom = 2 * (2 * y1 - y2 - y0)
+        if denom != 0:
+            return tau + (y2 - y0) / denom
+    return tau
+
+
+def yin_pitch(signal, fs, w_len=None, threshold=0.15, min_freq=50, max_freq=1000):
+    if w_len is None:
+        w_len = len(signal)
+
+    signal = np.asarray(signal[:w_len], dtype=np.float64)
+    d = _difference_function(signal, w_len // 2)
+    d_prime = _cmnd(d)
+
+    tau = _pick_period(d_prime, threshold)
+    if tau is None:
+        return None
+
+    frequency = fs / tau
+
+    # Filter frequencies outside the allowed range
+    if frequency < min_freq or frequency > max_freq:
+        return None
+
+    return frequency
+
+
+def yin_pitch_reference(signal, fs, w_len=None, threshold=0.15, min_freq=50, max_freq=1000):
+    # Original per-lag loop implementation, kept as the reference that
+    # check_yin.py compares the FFT version against.
+    if w_len is None:
+        w_len = len(signal)
+
+    signal = signal[:w_len]
+    # Step 1: Difference function
+    d = np.zeros(w_len // 2)
+    for tau in range(1, len(d)):
+        diff = signal[:-tau] - signal[tau:]
+        d[tau] = np.sum(diff ** 2)
+
+    # Step 2: Cumulative mean normalized difference function
+    d[0] = 1  # prevent division by zero
+    cumulative_sum = np.cumsum(d[1:])  # cumulative sum excluding d[0]
+    d_prime = np.empty_like(d)
+    d_prime[0] = 1
+    for tau in range(1, len(d)):
+        d_prime[tau] = d[tau] * tau / cumulative_sum[tau - 1] if cumulative_sum[tau - 1] != 0 else 1
+
+    # Step 3: Absolute threshold
+    candidates = np.where(d_prime < threshold)[0]
+    if len(candidates) == 0:
+        return None  # no pitch found below threshold
+
+    tau = candidates[0]
+
+    # Step 4: Parabolic interpolation for better precision
+    if tau + 1 < len(d_prime) and tau - 1 >= 0:
+        y0, y1, y2 = d_prime[tau - 1], d_prime[tau], d_prime[tau + 1]
+        denom = 2 * (2 * y1 - y2 - y0)
+        if denom != 0:
+            tau_adjusted = tau + (y2 - y0) / denom
+        else:
+            tau_adjusted = tau
+    else:
+        tau_adjusted = tau
+
+    # Step 5: Convert lag to frequency
+    frequency = fs / tau_adjusted
+
+    # Filter frequencies outside the allowed range
+    if frequency < min_freq or frequency > max_freq:
+        return None
+
+    return frequency
+
+class PitchEstimator:
+    """
+    Common streaming front for every estimator. Blocks of any size are
+    written into an internal ring and an estimate is produced every hop_size
+    samples over the last window_size samples; estimate() analyses one
+    standalone window instead. Subclasses implement _estimate() on
+    self._frame[:window_size] (zero-padded to an FFT size) and return a
+    frequency or None. Each estimate is timed, see cost_report(), and
+    leaves a 0..1 confidence for the frame it analysed (0 when unvoiced).
+    """
+
+    name = None
+
+    __slots__ = (
+        'fs', 'window_size', 'hop_size', 'min_freq', 'max_freq',
+        'last_pitch', 'confidence', 'frames', 'total_time',
+        '_ring', '_write_pos', '_filled', '_since_hop',
+        '_frame', '_spectrum', '_spectrum_conj', '_acf', '_squares', '_energy',
+    )
+
+    def __init__(self, fs=SAMPLE_RATE, window_size=None, hop_size=None, min_freq=50, max_freq=1000):
+        self.fs = fs
+        self.window_size = window_size or int(FRAME_DURATION * fs)
+        self.hop_size = hop_size or int(HOP_DURATION * fs)
+        self.min_freq = min_freq
+        self.max_freq = max_freq
+        self.last_pitch = None
+        self.confidence = 0.0
+        self.frames = 0
+        self.total_time = 0.0
+
+        w_len = self.window_size
+        fft_size = 1 << int(2 * w_len - 1).bit_length()
+
+        self._ring = np.zeros(w_len, dtype=np.float32)
+        self._write_pos = 0
+        self._filled = 0
+        self._since_hop = 0
+
+        self._frame = np.zeros(fft_size, dtype=np.float32)  # tail stays zero-padded
+        self._spectrum = np.empty(fft_size // 2 + 1, dtype=np.complex64)
+        self._spectrum_conj = np.empty_like(self._spectrum)
+        self._acf = np.empty(fft_size, dtype=np.float32)
+        self._squares = np.empty(w_len, dtype=np.float32)
+        self._energy = np.zeros(w_len + 1, dtype=np.float32)
+
+    def set_target(self, target_pc, tolerance_cents=50, octave_span=None, center_midi=None):
+        """Hint the expected pitch class. Estimators without a restricted search ignore it."""
+
+    def clear_target(self):
+        pass
+
+    def reset(self):
+        self._write_pos = 0
+        self._filled = 0
+        self._since_hop = 0
+        self.last_pitch = None
+
+    def process(self, block, on_estimate=None, analyze=True):
+        """
+        Consume a block of samples. Calls on_estimate(pitch) for every hop
+        completed inside the block (pitch is None when unvoiced). With
+        analyze=False the samples are only buffered and every completed hop
+        reports None without running the estimator.
+        """
+        w_len = self.window_size
+        pos = 0
+        remaining = len(block)
+        while remaining:
+            n = min(remaining, self.hop_size - self._since_hop, w_len - self._write_pos)
+            self._ring[self._write_pos:self._write_pos + n] = block[pos:pos + n]
+            self._write_pos = (self._write_pos + n) % w_len
+            self._filled = min(self._filled + n, w_len)
+            self._since_hop += n
+            pos += n
+            remaining -= n
+
+            if self._since_hop == self.hop_size:
+                self._since_hop = 0
+                if self._filled == w_len:
+                    self.last_pitch = self._estimate_ring() if analyze else None
+                    if on_estimate is not None:
+                        on_estimate(self.last_pitch)
+
+    def estimate(self, frame):
+        """Estimate the pitch of one window (at most window_size samples, zero-padded if shorter)."""
+        n = min(len(frame), self.window_size)
+        self._frame[:n] = frame[:n]
+        self._frame[n:self.window_size] = 0
+        return self._timed_estimate()
+
+    def _estimate_ring(self):
+        # Unroll the ring (oldest sample first) into the zero-padded frame
+        w_len = self.window_size
+        head = w_len - self._write_pos
+        self._frame[:head] = self._ring[self._write_pos:]
+        self._frame[head:w_len] = self._ring[:self._write_pos]
+        return self._timed_estimate()
+
+    def _timed_estimate(self):
+        start = time.perf_counter()
+        self.confidence = 0.0
+        pitch = self._estimate()
+        elapsed = time.perf_counter() - start
+        self.total_time += elapsed
+        _frame_time.observe(elapsed)
+        self.frames += 1
+        return pitch
+
+    def _estimate(self):
+        raise NotImplementedError
+
+    def _autocorrelate(self):
+        # Linear autocorrelation r(tau) of the frame via FFT, into self._acf
+        np.fft.rfft(self._frame, out=self._spectrum)
+        np.conjugate(self._spectrum, out=self._spectrum_conj)
+        np.multiply(self._spectrum, self._spectrum_conj, out=self._spectrum)
+        np.fft.irfft(self._spectrum, n=len(self._frame), out=self._acf)
+
+    def _running_energy(self):
+        # self._energy[k] = sum of squares of the first k samples
+        np.square(self._frame[:self.window_size], out=self._squares)
+        np.cumsum(self._squares, out=self._energy[1:])
+
+    def mean_cost_us(self):
+        return 1e6 * self.total_time / self.frames if self.frames else 0.0
+
+    def cost_report(self):
+        return f"{self.name}: {self.frames} frames, {self.mean_cost_us():.1f} us/frame"
+
+
+class YinEstimator(PitchEstimator):
+    """
+    YIN (de Cheveigne & Kawahara). The working buffers are allocated once
+    here and reused every hop, but numpy's FFT still allocates its own
+    temporaries (about 67 KB per frame at the default window), and the
+    target-restricted search allocates its small per-band correlation
+    outputs.
+    """
+
+    name = "yin"
+
+    __slots__ = (
+        'threshold', '_d', '_scratch', '_cumsum', '_d_prime', '_taus', '_below',
+        '_prefix', '_prefix_dot', '_energy_sum', '_lags', '_lag_taus', '_lag_bands', '_lag_work',
+        '_run_offsets', '_run_lags', '_run_taus', '_run_work', '_all_lags', '_all_taus', '_all_work',
+    )
+
+    def __init__(self, fs=SAMPLE_RATE, window_size=None, hop_size=None,
+                 threshold=0.15, min_freq=50, max_freq=1000):
+        super().__init__(fs, window_size, hop_size, min_freq, max_freq)
+        self.threshold = threshold
+
+        w_len = self.window_size
+        max_lag = w_len // 2
+        fft_size = len(self._frame)
+
+        self._d = np.empty(max_lag, dtype=np.float32)
+        self._scratch = np.empty(max_lag, dtype=np.float32)
+        self._cumsum = np.empty(max_lag, dtype=np.float32)
+        self._d_prime = np.empty(max_lag, dtype=np.float32)
+        self._taus = np.arange(max_lag, dtype=np.float32)
+        self._below = np.empty(max_lag, dtype=bool)
+
+        # Restricted (target-aware) search; enabled by set_target()
+        self._lags = None
+        self._prefix = np.zeros(fft_size + 1, dtype=np.float32)
+        self._prefix_dot = 0.0
+        self._energy_sum = np.empty(w_len + 1, dtype=np.float32)
+        self._run_offsets = np.arange(RUN_LAGS, dtype=np.intp)
+        self._run_lags = np.empty(RUN_LAGS, dtype=np.intp)
+        self._run_taus = np.empty(RUN_LAGS, dtype=np.float32)
+        self._run_work = _CmndWork(RUN_LAGS)
+
+        # Every lag, for scoring the lags below a restricted-band crossing
+        self._all_lags = np.arange(max_lag, dtype=np.intp)
+        self._all_taus = self._all_lags.astype(np.float32)
+        self._all_work = _CmndWork(max_lag)
+
+    def set_target(self, target_pc, tolerance_cents=50, octave_span=TARGET_OCTAVE_SPAN, center_midi=None):
+        """
+        Score the lag bands of one pitch class, within octave_span octaves
+        of center_midi, before anything else; see _estimate_target(). Pass
+        octave_span=None for every octave. Buffers for the new band set are
+        allocated here, not per frame.
+        """
+        lags = target_lag_bands(self.fs, target_pc, self.min_freq, self.max_freq,
+                                tolerance_cents, octave_span, center_midi)
+        lags = lags[lags < len(self._d) - 1]
+        if len(lags) == 0:
+            self.clear_target()
+            return
+
+        self._lags = lags
+        self._lag_taus = lags.astype(np.float32)
+        self._lag_bands = _contiguous_runs(lags)
+        self._lag_work = _CmndWork(len(lags))
+
+    def clear_target(self):
+        self._lags = None
+
+    def _estimate(self):
+        if self._lags is not None:
+            return self._estimate_target()
+        return self._estimate_full()
+
+    def _estimate_full(self):
+        w_len = self.window_size
+        max_lag = len(self._d)
+        self._autocorrelate()
+
+        # d(tau) = E[0:W-tau] + E[tau:W] - 2 r(tau)
+        energy = self._energy
+        self._running_energy()
+        d = self._d
+        np.subtract(energy[w_len], energy[:max_lag], out=d)
+        np.add(d, energy[w_len - max_lag + 1:][::-1], out=d)
+        np.multiply(self._acf[:max_lag], 2, out=self._scratch)
+        np.subtract(d, self._scratch, out=d)
+        np.maximum(d, 0, out=d)
+
+        # CMND. The cumulative sum is non-decreasing, so any zero entries
+        # (digital silence) form a prefix, which YIN defines as 1.
+        d_prime = self._d_prime
+        cumsum = self._cumsum
+        cumsum[0] = 0
+        np.cumsum(d[1:], out=cumsum[1:])
+        first_nonzero = 1 + int(np.searchsorted(cumsum[1:], 0, side='right'))
+        d_prime[:first_nonzero] = 1
+        np.multiply(d[first_nonzero:], self._taus[first_nonzero:], out=d_prime[first_nonzero:])
+        np.divide(d_prime[first_nonzero:], cumsum[first_nonzero:], out=d_prime[first_nonzero:])
+
+        np.less(d_prime, self.threshold, out=self._below)
+        tau = int(self._below.argmax())
+        if not self._below[tau]:
+            return None
+        self.confidence = 1.0 - float(d_prime[tau])
+
+        if 0 < tau < max_lag - 1:
+            y0, y1, y2 = d_prime[tau - 1], d_prime[tau], d_prime[tau + 1]
+            denom = 2 * (2 * y1 - y2 - y0)
+            if denom != 0:
+                tau = tau + (y2 - y0) / denom
+
+        frequency = self.fs / tau
+        if frequency < self.min_freq or frequency > self.max_freq:
+            return None
+        return float(frequency)
+
+    def _band_cmnd(self, lags, taus, bands, work):
+        """
+        Exact YIN CMND at the given lags only. r(tau) and its running sum
+        sum_{j<=tau} r(j) come from direct correlations over each contiguous
+        band; the energy terms and their running sums are prefix-sum lookups.
+        """
+        n = len(lags)
+        r, s, tmp, d, idx = work.r[:n], work.s[:n], work.tmp[:n], work.out[:n], work.idx[:n]
+        w_len = self.window_size
+        frame = self._frame
+        x = frame[:w_len]
+        energy = self._energy
+        energy_sum = self._energy_sum
+        total = energy[w_len]
+
+        for lo, hi, start in bands:
+            stop = start + hi - lo + 1
+            r[start:stop] = np.correlate(frame[lo:hi + w_len], x, 'valid')
+            s[start:stop] = np.correlate(self._prefix[lo + 1:hi + 1 + w_len], x, 'valid')
+        np.subtract(s, self._prefix_dot, out=s)
+
+        # d(tau) = E[0:W-tau] + E[tau:W] - 2 r(tau)
+        np.subtract(w_len, lags, out=idx)
+        np.take(energy, idx, out=d)
+        np.add(d, total, out=d)
+        np.take(energy, lags, out=tmp)
+        np.subtract(d, tmp, out=d)
+        np.multiply(r, 2, out=r)
+        np.subtract(d, r, out=d)
+        np.maximum(d, 0, out=d)
+
+        # sum_{j<=tau} d(j), from running sums of the same three terms
+        np.subtract(idx, 1, out=idx)
+        np.take(energy_sum, idx, out=tmp)
+        np.subtract(energy_sum[w_len - 1], tmp, out=tmp)
+        np.multiply(taus, total, out=r)
+        np.add(tmp, r, out=tmp)
+        np.take(energy_sum, lags, out=r)
+        np.subtract(tmp, r, out=tmp)
+        np.multiply(s, 2, out=s)
+        np.subtract(tmp, s, out=tmp)
+        np.maximum(tmp, 1e-12, out=tmp)
+
+        np.multiply(d, taus, out=d)
+        np.divide(d, tmp, out=d)
+        return d
+
+    def _first_crossing(self, lags, taus, bands, work):
+        # Shortest of lags whose CMND is under threshold, or None
+        cmnd = self._band_cmnd(lags, taus, bands, work)
+        below = work.below[:len(lags)]
+        np.less(cmnd, self.threshold, out=below)
+        i = int(below.argmax())
+        return int(lags[i]) if below[i] else None
+
+    def _cmnd_run(self, lo, hi):
+        # CMND over the consecutive lags lo..hi (at most RUN_LAGS of them)
+        n = hi - lo + 1
+        lags = self._run_lags[:n]
+        np.add(self._run_offsets[:n], lo, out=lags)
+        taus = self._run_taus[:n]
+        taus[:] = lags
+        return self._band_cmnd(lags, taus, ((lo, hi, 0),), self._run_work)
+
+    def _estimate_target(self):
+        w_len = self.window_size
+        frame = self._frame
+        self._running_energy()
+        if self._energy[w_len] == 0:
+            return None  # digital silence
+        np.cumsum(self._energy, out=self._energy_sum)
+        prefix = self._prefix
+        np.cumsum(frame[:w_len], out=prefix[1:w_len + 1])
+        prefix[w_len + 1:] = prefix[w_len]  # the frame is zero-padded past w_len
+        self._prefix_dot = float(np.dot(self._prefix[1:w_len + 1], frame[:w_len]))
+
+        tau = self._first_crossing(self._lags, self._lag_taus, self._lag_bands, self._lag_work)
+        if tau is None or tau > DIRECT_SCAN_LAGS:
+            # Nothing in the bands (the crossing may be the target in
+            # another octave), or too many shorter lags to score directly
+            return self._estimate_full()
+
+        # The full search stops at the first lag under threshold anywhere,
+        # and a dip outside the bands (a note a fifth above the target has
+        # one at three times its period, inside the target's lower octave)
+        # can only be ruled out by scoring every shorter lag. A crossing
+        # there is the pitch the full search would report, on target or not.
+        if tau > 1:
+            n = tau - 1
+            shorter = self._first_crossing(self._all_lags[1:tau], self._all_taus[1:tau], ((1, n, 0),),
+                                           self._all_work)
+            if shorter is not None:
+                tau = shorter
+        y0, y1, y2 = self._cmnd_run(tau - 1, tau + 1) if tau > 1 else (1.0, *self._cmnd_run(1, 2))
+        self.confidence = 1.0 - float(y1)
+
+        # Parabolic interpolation, same as the full search
+        denom = 2 * (2 * y1 - y2 - y0)
+        if denom != 0:
+            tau = tau + (y2 - y0) / denom
+
+        frequency = self.fs / tau
+        if frequency < self.min_freq or frequency > self.max_freq:
+            return None
+        return float(frequency)
+
+
+class _CmndWork:
+    __slots__ = ('r', 's', 'tmp', 'out', 'idx', 'below')
+
+    def __init__(self, n):
+        self.r = np.empty(n, dtype=np.float32)
+        self.s = np.empty(n, dtype=np.float32)
+        self.tmp = np.empty(n, dtype=np.float32)
+        self.out = np.empty(n, dtype=np.float32)
+        self.idx = np.empty(n, dtype=np.intp)
+        self.below = np.empty(n, dtype=bool)
+
+
+def _contiguous_runs(lags):
+    # [(first_lag, last_lag, index_of_first), ...] for each run of consecutive lags
+    breaks = np.flatnonzero(np.diff(lags) != 1) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(lags)])) - 1
+    return [(int(lags[s]), int(lags[e]), int(s)) for s, e in zip(starts, ends)]
+
+
+def target_lag_bands(fs, target_pc, min_freq, max_freq, tolerance_cents=50,
+                     octave_span=None, center_midi=None, lead_in=LAG_LEAD_IN):
+    """
+    Integer lags whose frequency lies within tolerance_cents of any note of
+    pitch class target_pc in [min_freq, max_freq]. Each band also starts
+    lead_in of a period early, where a YIN dip first crosses the threshold,
+    and ends one lag late for interpolation. With octave_span, only notes
+    within that many octaves of center_midi are included.
+    """
+    ratio = 2 ** (tolerance_cents / 1200)
+    lags = set()
+    for midi in range(target_pc, 128, 12):
+        if octave_span is not None and center_midi is not None and abs(midi - center_midi) > 12 * octave_span:
+            continue
+        freq = 440.0 * 2 ** ((midi - 69) / 12)
+        if freq * ratio < min_freq or freq / ratio > max_freq:
+            continue
+        lo = max(1, floor(fs / (freq * ratio) * (1 - lead_in)) - 1)
+        hi = ceil(fs / (freq / ratio)) + 1
+        lags.update(range(lo, hi + 1))
+    return np.array(sorted(lags), dtype=np.intp)
+
+
+class AutocorrEstimator(PitchEstimator):
+    """
+    Plain autocorrelation peak picking (what the tuner always used), with
+    the autocorrelation from an FFT instead of np.correlate, so it is
+    O(N log N), and a parabolic fit on the peak.
+    """
+
+    name = "autocorr"
+
+    __slots__ = ('_diff',)
+
+    def __init__(self, fs=SAMPLE_RATE, window_size=None, hop_size=None, min_freq=50, max_freq=1000):
+        super().__init__(fs, window_size, hop_size, min_freq, max_freq)
+        self._diff = np.empty(self.window_size - 1, dtype=np.float32)
+
+    def _estimate(self):
+        w_len = self.window_size
+        frame = self._frame[:w_len]
+        frame -= frame.mean()
+        self._autocorrelate()
+        corr = self._acf[:w_len]
+
+        np.subtract(corr[1:], corr[:-1], out=self._diff)
+        start = int(np.argmax(self._diff > 0))
+        if self._diff[start] <= 0:
+            return None
+        peak = int(np.argmax(corr[start:])) + start
+        if peak == 0:
+            return None
+        self.confidence = float(corr[peak] / corr[0]) if corr[0] > 0 else 0.0
+
+        period = peak
+        if 0 < peak < w_len - 1:
+            y0, y1, y2 = corr[peak - 1], corr[peak], corr[peak + 1]
+            denom = y0 - 2 * y1 + y2
+            if denom != 0:
+                period = peak + 0.5 * (y0 - y2) / denom
+
+        freq = self.fs / period
+        if self.min_freq < freq < self.max_freq:
+            return float(freq)
+        return None
+
+
+class McLeodEstimator(PitchEstimator):
+    """
+    McLeod Pitch Method: normalised square difference function
+    n(tau) = 2 r(tau) / (E[0:W-tau] + E[tau:W]), then the first key maximum
+    within MPM_CUTOFF of the highest one.
+    """
+
+    name = "mpm"
+
+    __slots__ = ('cutoff', 'clarity_threshold', 'clarity', '_nsdf', '_norm', '_is_peak')
+
+    def __init__(self, fs=SAMPLE_RATE, window_size=None, hop_size=None, min_freq=50, max_freq=1000,
+                 cutoff=MPM_CUTOFF, clarity_threshold=MPM_CLARITY):
+        super().__init__(fs, window_size, hop_size, min_freq, max_freq)
+        self.cutoff = cutoff
+        self.clarity_threshold = clarity_threshold
+        self.clarity = 0.0
+        max_lag = self.window_size // 2
+        self._nsdf = np.empty(max_lag, dtype=np.float32)
+        self._norm = np.empty(max_lag, dtype=np.float32)
+        self._is_peak = np.empty(max_lag - 2, dtype=bool)
+
+    def _estimate(self):
+        w_len = self.window_size
+        max_lag = len(self._nsdf)
+        self._autocorrelate()
+        self._running_energy()
+        energy = self._energy
+
+        norm = self._norm
+        np.subtract(energy[w_len], energy[:max_lag], out=norm)
+        np.add(norm, energy[w_len - max_lag + 1:][::-1], out=norm)
+        if norm[0] <= 0:
+            return None
+        np.maximum(norm, 1e-12, out=norm)
+        nsdf = self._nsdf
+        np.multiply(self._acf[:max_lag], 2, out=nsdf)
+        np.divide(nsdf, norm, out=nsdf)
+
+        # Key maxima only count after the first negative-going zero crossing
+        negative = np.flatnonzero(nsdf < 0)
+        if len(negative) == 0:
+            return None
+        first = max(1, int(negative[0]))
+
+        is_peak = self._is_peak
+        np.greater(nsdf[1:-1], nsdf[:-2], out=is_peak)
+        is_peak &= nsdf[1:-1] >= nsdf[2:]
+        is_peak &= nsdf[1:-1] > 0
+        is_peak[:first - 1] = False
+        peaks = np.flatnonzero(is_peak) + 1
+        if len(peaks) == 0:
+            return None
+
+        highest = float(nsdf[peaks].max())
+        tau = int(peaks[np.argmax(nsdf[peaks] >= self.cutoff * highest)])
+        self.clarity = float(nsdf[tau])
+        self.confidence = self.clarity
+        if self.clarity < self.clarity_threshold:
+            return None
+
+        y0, y1, y2 = nsdf[tau - 1], nsdf[tau], nsdf[tau + 1]
+        denom = y0 - 2 * y1 + y2
+        period = tau + 0.5 * (y0 - y2) / denom if denom != 0 else tau
+
+        freq = self.fs / period
+        if freq < self.min_freq or freq > self.max_freq:
+            return None
+        return float(freq)
+
+
+ESTIMATORS = {
+    cls.name: cls for cls in (YinEstimator, AutocorrEstimator, McLeodEstimator)
+}
+
+
+def make_estimator(name, **kwargs):
+    """Build an estimator by name ("yin", "autocorr" or "mpm")."""
+    try:
+        cls = ESTIMATORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown pitch estimator {name!r}; choose from {', '.join(ESTIMATORS)}")
+    return cls(**kwargs)
+
+
+class BatchYinEstimator:
+    """
+    YIN over several channels at once, for an ensemble listening on one
+    multi-input stream. Each hop the frames of every channel go through
+    the same FFT, difference function, CMND and threshold pick as
+    YinEstimator's full search, but as one 2-D computation, so the Python
+    overhead is paid once per hop rather than once per channel. Blocks are
+    shaped (samples, channels); each estimate reports an array of pitches
+    with NaN for unvoiced channels, and leaves per-channel confidences.
+    Channels quieter than silence_db are reported unvoiced.
+    """
+
+    name = "yin"
+
+    __slots__ = (
+        'channels', 'fs', 'window_size', 'hop_size', 'threshold', 'min_freq', 'max_freq',
+        'silence_level', 'pitches', 'confidence', 'frames', 'total_time',
+        '_ring', '_write_pos', '_filled', '_since_hop', '_frame', '_spectrum', '_acf',
+        '_squares', '_energy', '_d', '_cumsum', '_d_prime', '_taus', '_below', '_rows',
+        '_tau', '_valid',
+    )
+
+    def __init__(self, channels, fs=SAMPLE_RATE, window_size=None, hop_size=None,
+                 threshold=0.15, min_freq=50, max_freq=1000, silence_db=SILENCE_DB):
+        self.channels = channels
+        self.fs = fs
+        self.window_size = window_size or int(FRAME_DURATION * fs)
+        self.hop_size = hop_size or int(HOP_DURATION * fs)
+        self.threshold = threshold
+        self.min_freq = min_freq
+        self.max_freq = max_freq
+        self.silence_level = 10 ** (silence_db / 10)
+        self.frames = 0
+        self.total_time = 0.0
+
+        w_len = self.window_size
+        max_lag = w_len // 2
+        fft_size = 1 << int(2 * w_len - 1).bit_length()
+
+        self.pitches = np.full(channels, np.nan, dtype=np.float32)
+        self.confidence = np.zeros(channels, dtype=np.float32)
+        self._ring = np.zeros((channels, w_len), dtype=np.float32)
+        self._write_pos = 0
+        self._filled = 0
+        self._since_hop = 0
+
+        self._frame = np.zeros((channels, fft_size), dtype=np.float32)  # tails stay zero-padded
+        self._spectrum = np.empty((channels, fft_size // 2 + 1), dtype=np.complex64)
+        self._acf = np.empty((channels, fft_size), dtype=np.float32)
+        self._squares = np.empty((channels, w_len), dtype=np.float32)
+        self._energy = np.zeros((channels, w_len + 1), dtype=np.float32)
+        self._d = np.empty((channels, max_lag), dtype=np.float32)
+        self._cumsum = np.empty((channels, max_lag), dtype=np.float32)
+        self._d_prime = np.empty((channels, max_lag), dtype=np.float32)
+        self._taus = np.arange(max_lag, dtype=np.float32)
+        self._below = np.empty((channels, max_lag), dtype=bool)
+        self._rows = np.arange(channels)
+        self._tau = np.empty(channels, dtype=np.float32)
+        self._valid = np.empty(channels, dtype=bool)
+
+    def reset(self):
+        self._write_pos = 0
+        self._filled = 0
+        self._since_hop = 0
+        self.pitches.fill(np.nan)
+
+    def process(self, block, on_estimate=None):
+        """
+        Consume a (samples, channels) block. Calls on_estimate(pitches) for
+        every hop completed inside it; pitches is reused between calls, so
+        copy it to keep it.
+        """
+        w_len = self.window_size
+        pos = 0
+        remaining = len(block)
+        while remaining:
+            n = min(remaining, self.hop_size - self._since_hop, w_len - self._write_pos)
+            self._ring[:, self._write_pos:self._write_pos + n] = block[pos:pos + n].T
+            self._write_pos = (self._write_pos + n) % w_len
+            self._filled = min(self._filled + n, w_len)
+            self._since_hop += n
+            pos += n
+            remaining -= n
+
+            if self._since_hop == self.hop_size:
+                self._since_hop = 0
+                if self._filled == w_len:
+                    head = w_len - self._write_pos
+                    self._frame[:, :head] = self._ring[:, self._write_pos:]
+                    self._frame[:, head:w_len] = self._ring[:, :self._write_pos]
+                    self._timed_estimate()
+                    if on_estimate is not None:
+                        on_estimate(self.pitches)
+
+    def estimate(self, frames):
+        """Pitches of standalone (channels, window_size) frames; NaN where unvoiced."""
+        self._frame[:, :self.window_size] = frames
+        return self._timed_estimate()
+
+    def _timed_estimate(self):
+        start = time.perf_counter()
+        self._estimate()
+        elapsed = time.perf_counter() - start
+        self.total_time += elapsed
+        _batch_time.observe(elapsed)
+        self.frames += 1
+        return self.pitches
+
+    def _estimate(self):
+        w_len = self.window_size
+        max_lag = self._d.shape[1]
+        pitches = self.pitches
+        confidence = self.confidence
+
+        # Autocorrelation of every channel in one FFT pair
+        np.fft.rfft(self._frame, axis=1, out=self._spectrum)
+        np.multiply(self._spectrum, self._spectrum.conj(), out=self._spectrum)
+        np.fft.irfft(self._spectrum, n=self._frame.shape[1], axis=1, out=self._acf)
+
+        # d(tau) = E[0:W-tau] + E[tau:W] - 2 r(tau), a row per channel
+        energy = self._energy
+        np.square(self._frame[:, :w_len], out=self._squares)
+        np.cumsum(self._squares, axis=1, out=energy[:, 1:])
+        d = self._d
+        np.subtract(energy[:, w_len:], energy[:, :max_lag], out=d)
+        np.add(d, energy[:, w_len - max_lag + 1:][:, ::-1], out=d)
+        d_prime = self._d_prime
+        np.multiply(self._acf[:, :max_lag], 2, out=d_prime)
+        np.subtract(d, d_prime, out=d)
+        np.maximum(d, 0, out=d)
+
+        # CMND; lags whose cumulative sum is still zero (digital silence) are 1
+        cumsum = self._cumsum
+        cumsum[:, 0] = 0
+        np.cumsum(d[:, 1:], axis=1, out=cumsum[:, 1:])
+        d_prime.fill(1)
+        np.multiply(d, self._taus, out=d)
+        np.divide(d, cumsum, out=d_prime, where=cumsum > 0)
+        d_prime[:, 0] = 1
+
+        # First lag under the threshold per channel, then parabolic interpolation
+        np.less(d_prime, self.threshold, out=self._below)
+        tau = self._below.argmax(axis=1)
+        rows = self._rows
+        np.copyto(self._valid, self._below[rows, tau])
+        self._valid &= energy[:, w_len] >= self.silence_level * w_len
+        np.subtract(1.0, d_prime[rows, tau], out=confidence)
+        inner = np.clip(tau, 1, max_lag - 2)
+        y0 = d_prime[rows, inner - 1]
+        y1 = d_prime[rows, inner]
+        y2 = d_prime[rows, inner + 1]
+        denom = 2 * (2 * y1 - y2 - y0)
+        shift = np.divide(y2 - y0, denom, out=np.zeros_like(denom), where=(denom != 0) & (tau == inner))
+        np.add(tau, shift, out=self._tau)
+
+        np.divide(self.fs, self._tau, out=pitches, where=self._tau > 0)
+        self._valid &= (self._tau > 0) & (pitches >= self.min_freq) & (pitches <= self.max_freq)
+        pitches[~self._valid] = np.nan
+        confidence[~self._valid] = 0.0
+        return pitches
+
+    def mean_cost_us(self):
+        return 1e6 * self.total_time / self.frames if self.frames else 0.0
+
+    def cost_report(self):
+        return (f"{self.name} x{self.channels}: {self.frames} hops, {self.mean_cost_us():.1f} us/hop "
+                f"({self.mean_cost_us() / self.channels:.1f} us per channel)")
@@ -0,0 +1,136 @@
+#pitch_trace.py
+
+import os
+import queue
+import struct
+import threading
+
+import numpy as np
+
+from telemetry import telemetry
+
+MAGIC = b'PTRC'
+VERSION = 1
+HEADER = struct.Struct('<4sHHI4x')   # magic, version, header size, record size
+BLOCK_RECORDS = 1024   # records per preallocated block (about 10 s of hops)
+BLOCKS = 4             # blocks in the pool; the writer drains full ones
+
+_recorded = telemetry.counter("pitch_trace_frames_total", "Estimates written to the pitch trace")
+_trace_dropped = telemetry.counter("pitch_trace_dropped_total", "Estimates dropped because no trace block was free")
+
+TRACE_DTYPE = np.dtype([
+    ('time', '<f8'),        # seconds since the listening window opened (negative in the preroll)
+    ('f0', '<f4'),          # Hz, NaN when unvoiced
+    ('confidence', '<f4'),  # estimator confidence, 0..1
+    ('cents', '<f4'),       # signed cents off the target pitch class, NaN when unvoiced
+    ('rms', '<f4'),         # RMS of the hop that produced the estimate
+    ('trial', '<u4'),
+])
+
+
+class TraceRecorder:
+    """
+    Per-frame pitch log for a session. record() only writes one row into a
+    preallocated structured block, so it is safe on the audio or analysis
+    thread. Full blocks are handed to a writer thread that appends them to
+    an append-only file: a small header followed by raw TRACE_DTYPE
+    records, which read_trace() maps straight into NumPy. If the writer
+    falls so far behind that no block is free, records are dropped and
+    counted rather than blocking the caller.
+    """
+
+    def __init__(self, path, block_records=BLOCK_RECORDS, blocks=BLOCKS):
+        self.path = path
+        self.trial = 0
+        self.recorded = 0
+        self.dropped = 0
+        self._blocks = [np.zeros(block_records, dtype=TRACE_DTYPE) for _ in range(blocks)]
+        self._free = queue.Queue()
+        for block in self._blocks[1:]:
+            self._free.put(block)
+        self._full = queue.Queue()
+        self._block = self._blocks[0]
+        self._count = 0
+
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, HEADER.size, TRACE_DTYPE.itemsize))
+        else:
+            _check_header(path)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def record(self, time_sec, f0, confidence, cents, rms):
+        block = self._block
+        if block is None:
+            block = self._next_block()
+            if block is None:
+                self.dropped += 1
+                _trace_dropped.inc()
+                return
+        # One tuple store into the preallocated block; no allocation per row
+        block[self._count] = (time_sec, np.nan if f0 is None else f0, confidence,
+                              np.nan if cents is None else cents, rms, self.trial)
+        self._count += 1
+        self.recorded += 1
+        _recorded.inc()
+        if self._count == len(block):
+            self._full.put((block, self._count))
+            self._block = None
+            self._count = 0
+
+    def _next_block(self):
+        try:
+            self._block = self._free.get_nowait()
+        except queue.Empty:
+            return None
+        return self._block
+
+    def flush(self):
+        """Hands the partly filled block to the writer. Call from the recording thread, e.g. between trials."""
+        if self._block is not None and self._count:
+            self._full.put((self._block, self._count))
+            self._block = None
+            self._count = 0
+
+    def _write_loop(self):
+        while True:
+            item = self._full.get()
+            if item is None:
+                break
+            block, count = item
+            block[:count].tofile(self._file)
+            self._file.flush()
+            self._free.put(block)
+
+    def close(self):
+        self.flush()
+        self._full.put(None)
+        self._writer.join()
+        self._file.close()
+
+    def report(self):
+        return f"Pitch trace: {self.recorded} frames written to {self.path}, {self.dropped} dropped"
+
+
+def _check_header(path):
+    with open(path, 'rb') as f:
+        magic, version, header_size, record_size = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION or record_size != TRACE_DTYPE.itemsize:
+        raise ValueError(f"{path}: not a version {VERSION} pitch trace")
+    return header_size
+
+
+def read_trace(path):
+    """Maps a trace file into a read-only structured array without copying it."""
+    header_size = _check_header(path)
+    # A trailing partial record (e.g. after a crash) is ignored
+    count = (os.path.getsize(path) - header_size) // TRACE_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=TRACE_DTYPE)
+    return np.memmap(path, dtype=TRACE_DTYPE, mode='r', offset=header_size, shape=(count,))
+
+
+def trial_trace(trace, trial):
+    """The records of one trial."""
+    return trace[trace['trial'] == trial]
@@ -0,0 +1,258 @@
+#results_store.py
+#
+# Trial history in a local SQLite database. Writes are queued and
+# committed in batches by a background thread, so the training loop never
+# waits on disk. Accuracy per interval over time:
+#
+#   python results_store.py                  # per day, all history
+#   python results_store.py --days 30 --bucket week
+
+import argparse
+import itertools
+import queue
+import sqlite3
+import threading
+import time
+
+from telemetry import telemetry
+
+DEFAULT_DB = "results.db"
+BATCH_SIZE = 256          # rows per transaction at most
+FLUSH_INTERVAL_SEC = 1.0  # a partial batch is committed after this long
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    bpm INTEGER,
+    tonic_freq REAL,
+    repeats INTEGER,
+    feedback_mode TEXT,
+    random_tonic INTEGER,
+    intervals TEXT
+);
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    trial INTEGER NOT NULL,
+    time REAL NOT NULL,
+    interval TEXT NOT NULL,
+    semitones INTEGER NOT NULL,
+    tonic_freq REAL NOT NULL,
+    correct INTEGER NOT NULL,
+    note TEXT,
+    latency_sec REAL,
+    channel INTEGER
+);
+-- Covers the hourly accuracy query, so it never touches the table rows
+CREATE INDEX IF NOT EXISTS trials_semitones_time ON trials(semitones, time, correct);
+CREATE INDEX IF NOT EXISTS trials_session ON trials(session_id);
+-- Per interval per UTC day, kept up to date on insert. Daily and weekly
+-- queries read this instead of scanning trials, so their cost grows with
+-- days of history rather than with rows.
+CREATE TABLE IF NOT EXISTS daily_accuracy (
+    semitones INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    trials INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    latency_total REAL NOT NULL,
+    latency_count INTEGER NOT NULL,
+    PRIMARY KEY (semitones, day)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS trials_rollup AFTER INSERT ON trials BEGIN
+    INSERT INTO daily_accuracy VALUES (NEW.semitones, CAST(NEW.time / 86400 AS INTEGER), 1, NEW.correct,
+                                       IFNULL(NEW.latency_sec, 0), NEW.latency_sec IS NOT NULL)
+    ON CONFLICT (semitones, day) DO UPDATE SET
+        trials = trials + 1,
+        correct = correct + excluded.correct,
+        latency_total = latency_total + excluded.latency_total,
+        latency_count = latency_count + excluded.latency_count;
+END;
+"""
+
+_STOP = object()
+
+_rows = telemetry.counter("results_rows_written_total", "Session and trial rows committed to the results database")
+_commit_time = telemetry.histogram("results_commit_seconds", "Time to commit one batch of results rows")
+
+
+def _day(timestamp):
+    return int((timestamp or 0.0) // BUCKETS["day"])
+
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")    # readers do not block the writer
+    conn.execute("PRAGMA synchronous=NORMAL")  # still safe with WAL, far fewer fsyncs
+    return conn
+
+
+class ResultsStore:
+    """
+    Session and trial history. start_session() and record_trial() only
+    queue a row; the writer thread owns the database connection and
+    commits rows in transactions of up to BATCH_SIZE, each collecting
+    whatever arrives within FLUSH_INTERVAL_SEC of its first row. Queries open their own connection on
+    the calling thread and see everything committed so far.
+    """
+
+    def __init__(self, path=DEFAULT_DB, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL_SEC):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.batches = 0
+
+        conn = _connect(path)
+        with conn:
+            conn.executescript(SCHEMA)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(trials)")]
+            if "channel" not in columns:
+                # Databases from before ensemble sessions
+                conn.execute("ALTER TABLE trials ADD COLUMN channel INTEGER")
+            if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM daily_accuracy)").fetchone()[0]:
+                # Trials recorded before the rollup existed
+                conn.execute(
+                    "INSERT INTO daily_accuracy SELECT semitones, CAST(time / 86400 AS INTEGER) AS day, "
+                    "COUNT(*), SUM(correct), IFNULL(SUM(latency_sec), 0), COUNT(latency_sec) "
+                    "FROM trials GROUP BY semitones, day")
+        last_session = conn.execute("SELECT MAX(id) FROM sessions").fetchone()[0] or 0
+        conn.close()
+        # Ids are handed out here so starting a session never waits for the writer
+        self._session_ids = itertools.count(last_session + 1)
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def start_session(self, bpm, tonic_freq, repeats, feedback_mode, random_tonic, intervals):
+        """Queues the session row and returns its id for record_trial()."""
+        session_id = next(self._session_ids)
+        self._queue.put(("INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (session_id, time.time(), bpm, tonic_freq, repeats, feedback_mode,
+                          int(random_tonic), ",".join(str(semitones) for _, semitones in intervals))))
+        return session_id
+
+    def record_trial(self, session_id, trial, interval, semitones, tonic_freq, correct, note, latency_sec,
+                     channel=None):
+        """channel is the input channel of one player in an ensemble session, None for a solo one."""
+        self._queue.put(("INSERT INTO trials (session_id, trial, time, interval, semitones, tonic_freq, "
+                         "correct, note, latency_sec, channel) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (session_id, trial, time.time(), interval, semitones, tonic_freq,
+                          int(bool(correct)), note, latency_sec, channel)))
+
+    def _write_loop(self):
+        conn = _connect(self.path)
+        pending = []
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            # Rows arriving within flush_interval of the first share a transaction
+            deadline = time.monotonic() + self.flush_interval
+            done = None
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    done = item
+                    break
+                pending.append(item)
+                if len(pending) >= self.batch_size:
+                    self._commit(conn, pending)
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            self._commit(conn, pending)
+            if done is not None:
+                done.set()
+        conn.close()
+
+    def _commit(self, conn, pending):
+        if not pending:
+            return
+        started = time.perf_counter()
+        try:
+            with conn:
+                # Consecutive rows for the same statement go in one executemany
+                for sql, group in itertools.groupby(pending, key=lambda item: item[0]):
+                    conn.executemany(sql, [params for _, params in group])
+            self.rows_written += len(pending)
+            self.batches += 1
+            _rows.inc(len(pending))
+            _commit_time.observe(time.perf_counter() - started)
+        except sqlite3.Error as e:
+            print(f"Results store write error ({len(pending)} rows lost): {e}")
+        pending.clear()
+
+    def flush(self):
+        """Blocks until everything queued so far is committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def accuracy_by_interval(self, since=None, bucket="day"):
+        """
+        [(semitones, bucket_start, trials, correct)] per interval and time
+        bucket, oldest first. Day and week buckets come from the daily
+        rollup, so since is rounded down to the start of its UTC day.
+        """
+        width = BUCKETS[bucket]
+        conn = _connect(self.path)
+        try:
+            if width < BUCKETS["day"]:
+                return conn.execute(
+                    "SELECT semitones, CAST(time / ? AS INTEGER) * ? AS bucket, COUNT(*), SUM(correct) "
+                    "FROM trials WHERE time >= ? GROUP BY semitones, bucket ORDER BY semitones, bucket",
+                    (width, width, since or 0.0)).fetchall()
+            days = width // BUCKETS["day"]
+            return conn.execute(
+                "SELECT semitones, (day / ?) * ? AS bucket, SUM(trials), SUM(correct) "
+                "FROM daily_accuracy WHERE day >= ? GROUP BY semitones, bucket ORDER BY semitones, bucket",
+                (days, width, _day(since))).fetchall()
+        finally:
+            conn.close()
+
+    def interval_totals(self, since=None):
+        """[(semitones, trials, correct, mean latency of correct answers)] per interval, from whole days."""
+        conn = _connect(self.path)
+        try:
+            return conn.execute(
+                "SELECT semitones, SUM(trials), SUM(correct), SUM(latency_total) / NULLIF(SUM(latency_count), 0) "
+                "FROM daily_accuracy WHERE day >= ? GROUP BY semitones ORDER BY semitones",
+                (_day(since),)).fetchall()
+        finally:
+            conn.close()
+
+    def report(self):
+        return f"Results store: {self.rows_written} rows in {self.batches} transactions to {self.path}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Accuracy per interval from the results database.")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"database file (default: {DEFAULT_DB})")
+    parser.add_argument("--days", type=float, help="only the last this many days")
+    parser.add_argument("--bucket", default="day", choices=list(BUCKETS), help="time bucket (default: day)")
+    args = parser.parse_args(argv)
+
+    store = ResultsStore(args.db)
+    since = time.time() - args.days * 86400 if args.days else None
+    for semitones, trials, correct, latency in store.interval_totals(since):
+        latency = f", mean latency {latency:.2f} s" if latency is not None else ""
+        print(f"{semitones:2d} semitones: {correct}/{trials} correct ({100 * correct / trials:.1f}%){latency}")
+    print()
+    for semitones, bucket, trials, correct in store.accuracy_by_interval(since, args.bucket):
+        day = time.strftime("%Y-%m-%d %H:%M", time.localtime(bucket))
+        print(f"{semitones:2d} semitones  {day}  {correct}/{trials} ({100 * correct / trials:.1f}%)")
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,79 @@
+#ring_buffer.py
+
+import numpy as np
+
+
+class SampleRing:
+    """
+    Single-producer / single-consumer ring of audio samples.
+
+    The audio callback is the only writer and one analysis thread is the only
+    reader. Each side only ever advances its own counter, and the writer
+    publishes `written` after the samples are in place, so no lock is needed.
+    If the reader falls more than `capacity` samples behind, the oldest
+    samples are overwritten and the reader skips forward (see `lost`).
+    With channels set, each slot holds one frame of that many channels and
+    blocks are shaped (samples, channels).
+    """
+
+    __slots__ = ('capacity', 'written', 'read_pos', 'lost', '_data')
+
+    def __init__(self, capacity, dtype=np.float32, channels=None):
+        self.capacity = capacity
+        self.written = 0   # total samples ever written (producer-owned)
+        self.read_pos = 0  # total samples ever consumed (consumer-owned)
+        self.lost = 0      # samples overwritten before the reader got to them
+        self._data = np.zeros(capacity if channels is None else (capacity, channels), dtype=dtype)
+
+    def reset(self):
+        # Only safe while no producer is running
+        self.written = 0
+        self.read_pos = 0
+        self.lost = 0
+
+    def write(self, block):
+        n = len(block)
+        if n > self.capacity:
+            block = block[-self.capacity:]
+            skipped = n - self.capacity
+        else:
+            skipped = 0
+        m = len(block)
+        start = (self.written + skipped) % self.capacity
+        first = min(m, self.capacity - start)
+        self._data[start:start + first] = block[:first]
+        self._data[:m - first] = block[first:]
+        self.written += n
+
+    def available(self):
+        return self.written - self.read_pos
+
+    def skip(self, n):
+        self.read_pos += n
+
+    def read(self, out):
+        """Copy the oldest len(out) unread samples into out and consume them."""
+        backlog = self.written - self.read_pos
+        if backlog > self.capacity:
+            self.lost += backlog - self.capacity
+            self.read_pos = self.written - self.capacity
+        self.copy_at(self.read_pos, out)
+        self.read_pos += len(out)
+        return out
+
+    def copy_at(self, pos, out):
+        """Copy samples starting at absolute position pos into out without consuming them."""
+        n = len(out)
+        start = pos % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self._data[start:start + first]
+        out[first:n] = self._data[:n - first]
+        return out
+
+    def latest(self, n):
+        """Zero-copy views (older, newer) of the most recent n samples."""
+        end = self.written % self.capacity
+        start = end - n
+        if start >= 0:
+            return self._data[start:end], self._data[:0]
+        return self._data[start:], self._data[:end]
@@ -0,0 +1,112 @@
+#scheduler.py
+
+import heapq
+import itertools
+import queue
+import threading
+
+from clock import real_clock
+from telemetry import telemetry
+
+_dispatch = telemetry.histogram("scheduler_dispatch_seconds", "Delay from a beat to each action it made due")
+
+
+class BeatScheduler(threading.Thread):
+    """
+    One thread that runs timed actions keyed to (bar, beat). Register
+    on_beat with the Metronome; each beat it advances the position and
+    runs every action that has come due, in (bar, beat, order scheduled)
+    order, so playback, prompts and UI updates always happen in the same
+    sequence. Actions must be quick (start a sound, post a UI update);
+    anything long belongs on the caller's own thread.
+
+    With a VirtualClock the actions run inline in on_beat instead, and
+    wait_for() advances the clock until its beat arrives.
+    """
+
+    def __init__(self, beats_per_bar, clock=None):
+        super().__init__(daemon=True)
+        self.beats_per_bar = beats_per_bar
+        self.clock = clock or real_clock
+        self.position = (0, 0)  # (bar, beat) of the last beat heard; bars count from 1
+        self.beat_time = None   # clock time that beat arrived
+        self._events = []       # heap of (bar, beat, seq, action, args)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeups = queue.Queue()
+        self._waiters = []
+        self._stopped = threading.Event()
+        self.error = None       # set by fail(); the reason the beats stopped
+
+    def on_beat(self, beat_num):
+        # Metronome callback: only records the beat, the actions run on this thread
+        bar, _ = self.position
+        self.beat_time = self.clock.now()
+        self.position = (bar + 1 if beat_num == 1 else bar, beat_num)
+        if self.clock.virtual:
+            self._run_due()
+        else:
+            self._wakeups.put(None)
+
+    def following(self, bar=None, beat=None):
+        """The (bar, beat) after the given one, or after the current position."""
+        if bar is None:
+            bar, beat = self.position
+        return (bar + 1, 1) if beat >= self.beats_per_bar else (bar, beat + 1)
+
+    def at(self, bar, beat, action, *args):
+        """Runs action(*args) on the scheduler thread when (bar, beat) is reached."""
+        with self._lock:
+            heapq.heappush(self._events, (bar, beat, next(self._seq), action, args))
+        if (bar, beat) <= self.position:
+            if self.clock.virtual:
+                self._run_due()
+            else:
+                self._wakeups.put(None)
+
+    def wait_for(self, bar, beat=1):
+        """Blocks until (bar, beat) and every action scheduled before this call for it have run."""
+        reached = threading.Event()
+        with self._lock:
+            self._waiters.append(reached)
+        self.at(bar, beat, reached.set)
+        if self._stopped.is_set():
+            reached.set()
+        self.clock.wait(reached)
+        with self._lock:
+            self._waiters.remove(reached)
+        return not self._stopped.is_set()
+
+    def start(self):
+        if not self.clock.virtual:
+            super().start()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._wakeups.get()
+            self._run_due()
+
+    def _run_due(self):
+        while True:
+            with self._lock:
+                if not self._events or self._events[0][:2] > self.position:
+                    return
+                _, _, _, action, args = heapq.heappop(self._events)
+            if self.beat_time is not None:
+                _dispatch.observe(self.clock.now() - self.beat_time)
+            try:
+                action(*args)
+            except Exception as e:
+                print(f"Scheduler action error: {e}")
+
+    def fail(self, error):
+        """The beat source died: stop, waking every wait_for(), and keep error for the caller."""
+        self.error = error
+        self.stop()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeups.put(None)
+        with self._lock:
+            for reached in self._waiters:
+                reached.set()
@@ -0,0 +1,82 @@
+#startup.py
+#
+# Everything slow that used to happen before the first window appeared
+# (numpy/sounddevice/pygame imports, mixer init, device discovery, opening
+# the results database) runs here on a background thread instead. `python startup.py` runs the same
+# warm-up in the foreground and fails if it goes over STARTUP_BUDGET_SEC.
+
+import importlib
+import threading
+import time
+
+STARTUP_BUDGET_SEC = 1.5
+MIXER_SETTINGS = dict(frequency=44100, size=-16, channels=1, buffer=512)
+
+_started_at = time.perf_counter()
+timings = []           # (phase, seconds) in the order they ran
+ready = threading.Event()
+error = None
+results = None         # results_store.ResultsStore, when warm_up was given a path
+_thread = None
+
+
+def _timed(phase, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    timings.append((phase, time.perf_counter() - start))
+    return result
+
+
+def mark(phase):
+    """Records how long after startup.py was imported phase happened (e.g. the window appearing)."""
+    timings.append((phase, time.perf_counter() - _started_at))
+
+
+def warm_up(modules=("interval_trainer",), results_path=None):
+    global error, results
+    try:
+        _timed("import numpy", importlib.import_module, "numpy")
+        _timed("import sounddevice", importlib.import_module, "sounddevice")
+        pygame = _timed("import pygame", importlib.import_module, "pygame")
+        if not pygame.mixer.get_init():
+            _timed("mixer init", pygame.mixer.init, **MIXER_SETTINGS)
+        devices = _timed("import devices", importlib.import_module, "devices")
+        _timed("device discovery", devices.configure_devices)
+        _timed("device list", devices.input_devices)
+        for name in modules:
+            _timed(f"import {name}", importlib.import_module, name)
+        if results_path is not None:
+            # Schema, migrations and any rollup backfill happen here, not on the UI thread
+            results_store = importlib.import_module("results_store")
+            results = _timed("results store", results_store.ResultsStore, results_path)
+    except Exception as e:
+        error = e
+        print(f"Startup failed: {e}")
+    finally:
+        ready.set()
+
+
+def start_warm_up(modules=("interval_trainer",), results_path=None):
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=warm_up, args=(modules, results_path), daemon=True)
+        _thread.start()
+    return ready
+
+
+def warm_up_seconds():
+    return sum(seconds for phase, seconds in timings if phase.startswith(("import", "mixer", "device", "results")))
+
+
+def report(budget=STARTUP_BUDGET_SEC):
+    lines = [f"  {phase:<28} {seconds * 1000:8.1f} ms" for phase, seconds in timings]
+    total = warm_up_seconds()
+    verdict = "within" if total <= budget else "OVER"
+    lines.append(f"  {'warm-up total':<28} {total * 1000:8.1f} ms ({verdict} the {budget * 1000:.0f} ms budget)")
+    return "Startup:\n" + "\n".join(lines)
+
+
+if __name__ == "__main__":
+    warm_up()
+    print(report())
+    raise SystemExit(1 if error is not None or warm_up_seconds() > STARTUP_BUDGET_SEC else 0)
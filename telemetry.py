@@ -0,0 +1,235 @@
+#telemetry.py
+#
+# Counters and latency histograms for the real-time paths, cheap enough to
+# stay on in every session. Each module registers its metrics once at
+# import and updates them in place:
+#
+#   _frame_time = telemetry.histogram("pitch_frame_seconds", "Estimator time per analysed frame")
+#   _frame_time.observe(elapsed)
+#
+# telemetry.dump("telemetry.json") or telemetry.dump("telemetry.prom")
+# writes everything as JSON or Prometheus text. SamplingProfiler is an
+# opt-in stack sampler for chosen threads.
+
+import bisect
+import collections
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+# Bucket upper bounds in seconds: 10 us to 10 s, four per decade
+BUCKET_BOUNDS = tuple(round(10 ** (e / 4), 9) for e in range(-20, 5))
+PROFILE_INTERVAL_SEC = 0.005
+
+
+class Histogram:
+    """
+    Fixed log-spaced buckets, so observe() is a bisect and two adds with no
+    allocation. Each metric is meant to be updated from one thread; reads
+    from another thread may be a sample behind, which is fine for reports.
+    """
+
+    __slots__ = ('name', 'help', 'bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, name, help="", bounds=BUCKET_BOUNDS):
+        self.name = name
+        self.help = help
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (the max for the top bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def snapshot(self):
+        return {
+            "type": "histogram",
+            "help": self.help,
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "buckets": dict(zip([*map(str, self.bounds), "+Inf"], self.counts)),
+        }
+
+
+class Counter:
+    __slots__ = ('name', 'help', 'value')
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def reset(self):
+        self.value = 0
+
+    def snapshot(self):
+        return {"type": "counter", "help": self.help, "value": self.value}
+
+
+class Telemetry:
+    """Registry of every counter and histogram in the process."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, help):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help)
+            return metric
+
+    def histogram(self, name, help=""):
+        return self._register(Histogram, name, help)
+
+    def counter(self, name, help=""):
+        return self._register(Counter, name, help)
+
+    def reset(self):
+        for metric in list(self.metrics.values()):
+            metric.reset()
+        self.started = time.time()
+
+    def snapshot(self):
+        return {
+            "started": self.started,
+            "time": time.time(),
+            "metrics": {name: metric.snapshot() for name, metric in sorted(self.metrics.items())},
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            if isinstance(metric, Counter):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {metric.value}")
+                continue
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, n in zip([*map(repr, metric.bounds), "+Inf"], metric.counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum {metric.total}")
+            lines.append(f"{name}_count {metric.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Writes every metric to path: Prometheus text for .prom/.txt, JSON otherwise."""
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)  # scrapers never see a half-written file
+
+    def dump_on_signal(self, path, signum=getattr(signal, "SIGUSR1", None)):
+        """`kill -USR1 <pid>` then writes a dump to path. Call from the main thread; a no-op on Windows."""
+        if signum is None:
+            return
+        signal.signal(signum, lambda *_: self.dump(path))
+
+    def report(self):
+        parts = []
+        for name, metric in sorted(self.metrics.items()):
+            if isinstance(metric, Counter):
+                parts.append(f"{name}={metric.value}")
+            elif metric.count:
+                parts.append(f"{name} p50={1000 * metric.percentile(50):.2f}ms "
+                             f"p99={1000 * metric.percentile(99):.2f}ms max={1000 * metric.max:.2f}ms")
+        return "Telemetry: " + ("; ".join(parts) if parts else "no samples")
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Samples the stacks of the given threads every interval and counts them,
+    so hot spots show up without instrumenting anything. Costs nothing
+    until started. write() emits collapsed stacks ("a;b;c count"), the
+    input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, threads, interval=PROFILE_INTERVAL_SEC):
+        super().__init__(daemon=True)
+        self.threads = list(threads)
+        self.interval = interval
+        self.samples = 0
+        self.stacks = collections.Counter()
+        self._stop_event = threading.Event()
+
+    def add_thread(self, thread):
+        self.threads.append(thread)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for thread in self.threads:
+                frame = frames.get(thread.ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(thread.name)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def top(self, n=10):
+        """[(function, share of samples)] by samples with the function on top of the stack."""
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [(name, count / total) for name, count in leaves.most_common(n)]
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+telemetry = Telemetry()
@@ -0,0 +1,114 @@
+#tone_cache.py
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from mixer import make_sound
+from telemetry import telemetry
+
+SAMPLE_RATE = 44100
+MAX_TONES = 128        # Sounds kept in memory before the least recently used is dropped
+FREQ_DECIMALS = 2      # frequencies closer than this are the same cache entry
+ATTACK_MS = 10         # linear fade-in, so a tone starts without a click
+RELEASE_MS = 60        # linear fade-out at the end
+
+_hits = telemetry.counter("tone_cache_hits_total", "Tones served from the cache")
+_misses = telemetry.counter("tone_cache_misses_total", "Tones synthesised or loaded on a cache miss")
+
+
+def render_tone(frequency, duration_ms, volume=0.1, sample_rate=SAMPLE_RATE,
+                attack_ms=ATTACK_MS, release_ms=RELEASE_MS):
+    """Sine tone with a linear attack/release envelope as int16 samples, ready for the mixer."""
+    duration = duration_ms / 1000.0
+    t = np.linspace(0, duration, int(sample_rate * duration), False)
+    tone = np.sin(2 * np.pi * frequency * t) * (volume * 32767)
+
+    attack = min(int(attack_ms * sample_rate / 1000), len(tone))
+    release = min(int(release_ms * sample_rate / 1000), len(tone) - attack)
+    if attack:
+        tone[:attack] *= np.linspace(0, 1, attack, endpoint=False)
+    if release:
+        tone[len(tone) - release:] *= np.linspace(1, 0, release)
+    return tone.astype(np.int16)
+
+
+class ToneCache:
+    """
+    Process-wide cache of synthesised tones keyed by (frequency, duration,
+    volume, sample rate, envelope). Sounds are built straight from the
+    int16 samples in the mixer's actual format (see mixer.make_sound)
+    rather than encoded to WAV and decoded again. With store_dir set, the
+    samples are also kept as .npy files so a later run skips synthesis.
+    """
+
+    def __init__(self, max_tones=MAX_TONES, store_dir=None):
+        self.max_tones = max_tones
+        self.store_dir = store_dir
+        self.hits = 0
+        self.misses = 0
+        self._sounds = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(frequency, duration_ms, volume=0.1, sample_rate=SAMPLE_RATE,
+            attack_ms=ATTACK_MS, release_ms=RELEASE_MS):
+        return (round(float(frequency), FREQ_DECIMALS), int(duration_ms), float(volume), int(sample_rate),
+                int(attack_ms), int(release_ms))
+
+    def get(self, frequency, duration_ms, volume=0.1, sample_rate=SAMPLE_RATE,
+            attack_ms=ATTACK_MS, release_ms=RELEASE_MS):
+        key = self.key(frequency, duration_ms, volume, sample_rate, attack_ms, release_ms)
+        with self._lock:
+            sound = self._sounds.get(key)
+            if sound is not None:
+                self._sounds.move_to_end(key)
+                self.hits += 1
+                _hits.inc()
+                return sound
+            self.misses += 1
+            _misses.inc()
+
+        # Synthesise outside the lock; two threads racing on one key just do it twice
+        sound = make_sound(self._samples(key), key[3])
+        with self._lock:
+            self._sounds[key] = sound
+            self._sounds.move_to_end(key)
+            while len(self._sounds) > self.max_tones:
+                self._sounds.popitem(last=False)
+        return sound
+
+    def _samples(self, key):
+        path = self._store_path(key)
+        if path is not None and os.path.exists(path):
+            return np.load(path)
+        samples = render_tone(*key)
+        if path is not None:
+            os.makedirs(self.store_dir, exist_ok=True)
+            np.save(path, samples)
+        return samples
+
+    def _store_path(self, key):
+        if self.store_dir is None:
+            return None
+        frequency, duration_ms, volume, sample_rate, attack_ms, release_ms = key
+        return os.path.join(self.store_dir, f"tone_{frequency:.2f}_{duration_ms}_{volume:g}_{sample_rate}"
+                                            f"_{attack_ms}_{release_ms}.npy")
+
+    def clear(self):
+        with self._lock:
+            self._sounds.clear()
+
+    def report(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return f"Tone cache: {len(self._sounds)} tones, {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
+
+
+tone_cache = ToneCache()
+
+
+def get_tone(frequency, duration_ms, volume=0.1, sample_rate=SAMPLE_RATE):
+    return tone_cache.get(frequency, duration_ms, volume, sample_rate)
@@ -0,0 +1,74 @@
+#tone_pipeline.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mixer import make_sound
+from telemetry import telemetry
+from tone_cache import SAMPLE_RATE, render_tone
+
+LOOKAHEAD_TRIALS = 3   # trials rendered ahead of the one being played
+TONE_DURATION_MS = 600
+TONE_VOLUME = 0.1
+
+_waits = telemetry.histogram("tone_pipeline_wait_seconds", "Time a trial waited for its tones to finish rendering")
+
+
+def note_frequency(tonic_freq, semitones):
+    return tonic_freq * (2 ** (semitones / 12))
+
+
+class TonePipeline:
+    """
+    Renders the tonic and interval tones for upcoming trials on a background
+    thread while the current trial runs. Only trials that have been
+    submitted and not yet taken are held, so memory stays bounded by the
+    look-ahead window instead of every tonic x interval combination. These
+    one-off tones bypass the shared ToneCache so they do not evict tones
+    that are reused.
+    """
+
+    def __init__(self, trials, lookahead=LOOKAHEAD_TRIALS, duration_ms=TONE_DURATION_MS,
+                 volume=TONE_VOLUME, sample_rate=SAMPLE_RATE):
+        self.trials = trials   # list of (tonic_freq, semitones)
+        self.lookahead = lookahead
+        self.duration_ms = duration_ms
+        self.volume = volume
+        self.sample_rate = sample_rate
+        self.waits = 0         # takes that found their tones not yet rendered
+        self._pending = {}
+        self._submitted = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tone-pipeline")
+        self.advance(0)
+
+    def _render(self, tonic_freq, semitones):
+        tonic = render_tone(tonic_freq, self.duration_ms, self.volume, self.sample_rate)
+        upper = render_tone(note_frequency(tonic_freq, semitones), self.duration_ms, self.volume,
+                            self.sample_rate)
+        return make_sound(tonic, self.sample_rate), make_sound(upper, self.sample_rate)
+
+    def advance(self, index):
+        """Makes sure trials index .. index + lookahead are queued for rendering."""
+        end = min(len(self.trials), index + self.lookahead + 1)
+        while self._submitted < end:
+            i = self._submitted
+            self._pending[i] = self._executor.submit(self._render, *self.trials[i])
+            self._submitted += 1
+
+    def take(self, index):
+        """Returns (tonic_sound, interval_sound) for a trial and forgets them."""
+        self.advance(index)
+        future = self._pending.pop(index)
+        if future.done():
+            return future.result()
+        self.waits += 1
+        started = time.perf_counter()
+        sounds = future.result()
+        _waits.observe(time.perf_counter() - started)
+        return sounds
+
+    def close(self):
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=False)
@@ -1,13 +1,27 @@
 import numpy as np
-import sounddevice as sd
 import tkinter as tk
-from threading import Thread
-import time
+from threading import Thread, Event
+
+from audio_backend import LiveBackend
+from decimator import Decimator, decimation_factor
+from ring_buffer import SampleRing
+from gate import SignalGate
+from pitch_engine import make_estimator
 
 SAMPLE_RATE = 44100
 WINDOW_SIZE = 2048
 MIN_FREQ = 70
 MAX_FREQ = 350
+DECIMATE = True  # low-pass and downsample before estimating
+HOP_DURATION = 0.01      # new audio needed before the next analysis
+HISTORY_DURATION = 1.0   # capture ring length
+ESTIMATOR = "autocorr"  # any name from pitch_engine.ESTIMATORS
+RENDER_INTERVAL_MS = 33        # Tk-side redraw period
+DISPLAY_CENTS_THRESHOLD = 0.5  # smaller needle moves are not redrawn
+
+GAUGE_CX = 200
+GAUGE_CY = 180
+GAUGE_RADIUS = 80
 
 NOTE_FREQS = {
     'E2': 82.41,
@@ -19,7 +33,7 @@ NOTE_FREQS = {
 }
 
 class TunerApp:
-    def __init__(self, root):
+    def __init__(self, root, backend=None):
         self.root = root
         self.root.title("Guitar Tuner")
         self.root.geometry("400x300")
@@ -34,53 +48,52 @@ class TunerApp:
         self.freq_label = tk.Label(root, text="", font=("Helvetica", 16), fg="white", bg="black")
         self.freq_label.pack()
 
+        self.draw_gauge()
+        self.pending = None  # newest reading from the analysis thread
+        self.shown = None    # reading currently on screen
+
         self.running = True
-        self.audio_buffer = np.zeros(WINDOW_SIZE)
-        self.buffer_index = 0
-        self.lock = False
-
-        self.stream = sd.InputStream(
-            samplerate=SAMPLE_RATE,
-            channels=1,
-            blocksize=WINDOW_SIZE // 2,
-            callback=self.audio_callback
-        )
+
+        # The window still spans WINDOW_SIZE input samples, just at the
+        # decimated rate when DECIMATE is on.
+        factor = decimation_factor(SAMPLE_RATE, MAX_FREQ) if DECIMATE else 1
+        self.decimator = Decimator(factor) if factor > 1 else None
+        self.analysis_rate = SAMPLE_RATE / factor
+        self.window_size = WINDOW_SIZE // factor
+        self.hop_size = max(1, int(HOP_DURATION * self.analysis_rate))
+        self.window = np.zeros(self.window_size, dtype=np.float32)
+        self.gate = SignalGate(self.window_size)
+        self.estimator = make_estimator(ESTIMATOR, fs=self.analysis_rate, window_size=self.window_size,
+                                        min_freq=MIN_FREQ, max_freq=MAX_FREQ)
+
+        # The callback appends to the ring and wakes the analysis thread
+        # once per hop of new audio; the thread always analyses the newest
+        # window, so windows that arrive while it is busy are skipped.
+        self.ring = SampleRing(int(HISTORY_DURATION * self.analysis_rate))
+        self.data_ready = Event()
+        self.analysed_upto = 0
+        self.skipped_windows = 0
+
+        self.backend = backend or LiveBackend()
+        self.stream = self.backend.input_stream(SAMPLE_RATE, int(HOP_DURATION * SAMPLE_RATE), self.audio_callback)
         self.stream.start()
 
         self.update_thread = Thread(target=self.update_loop)
         self.update_thread.daemon = True
         self.update_thread.start()
 
+        self.root.after(RENDER_INTERVAL_MS, self.render)
         self.root.protocol("WM_DELETE_WINDOW", self.stop)
 
     def audio_callback(self, indata, frames, time_info, status):
         if status:
             print(status)
-        if self.lock:
-            return
         chunk = indata[:, 0]
-        n = len(chunk)
-        if n > WINDOW_SIZE:
-            chunk = chunk[:WINDOW_SIZE]
-            n = WINDOW_SIZE
-        self.audio_buffer[:-n] = self.audio_buffer[n:]
-        self.audio_buffer[-n:] = chunk
-
-    def autocorrelate(self, signal):
-        signal -= np.mean(signal)
-        corr = np.correlate(signal, signal, mode='full')
-        corr = corr[len(corr)//2:]
-        d = np.diff(corr)
-        start = np.nonzero(d > 0)[0]
-        if len(start) == 0:
-            return None
-        start = start[0]
-        peak = np.argmax(corr[start:]) + start
-        period = peak
-        freq = SAMPLE_RATE / period
-        if MIN_FREQ < freq < MAX_FREQ:
-            return freq
-        return None
+        if self.decimator is not None:
+            chunk = self.decimator.process(chunk)
+        self.ring.write(chunk)
+        if self.ring.written - self.analysed_upto >= self.hop_size:
+            self.data_ready.set()
 
     def find_nearest_note(self, freq):
         if freq is None:
@@ -90,52 +103,80 @@ class TunerApp:
         cents = 1200 * np.log2(freq / ref)
         return name, freq, cents
 
-    def draw_needle(self, cents):
-        self.canvas.delete("all")
-        width = 400
-        height = 200
-        center_x = width // 2
-        center_y = height - 20
-        radius = 80
-
-        self.canvas.create_arc(center_x - radius, center_y - radius,
-                               center_x + radius, center_y + radius,
+    def draw_gauge(self):
+        # Static parts are drawn once; only the needle moves afterwards
+        self.canvas.create_arc(GAUGE_CX - GAUGE_RADIUS, GAUGE_CY - GAUGE_RADIUS,
+                               GAUGE_CX + GAUGE_RADIUS, GAUGE_CY + GAUGE_RADIUS,
                                start=30, extent=120, outline="gray", style=tk.ARC, width=2)
 
         for i in range(-50, 60, 10):
             angle = np.radians(90 - i * 1.2)
-            x1 = center_x + (radius - 10) * np.cos(angle)
-            y1 = center_y - (radius - 10) * np.sin(angle)
-            x2 = center_x + radius * np.cos(angle)
-            y2 = center_y - radius * np.sin(angle)
+            x1 = GAUGE_CX + (GAUGE_RADIUS - 10) * np.cos(angle)
+            y1 = GAUGE_CY - (GAUGE_RADIUS - 10) * np.sin(angle)
+            x2 = GAUGE_CX + GAUGE_RADIUS * np.cos(angle)
+            y2 = GAUGE_CY - GAUGE_RADIUS * np.sin(angle)
             self.canvas.create_line(x1, y1, x2, y2, fill="white", width=1)
 
-        if cents is not None:
-            cents = max(-50, min(50, cents))
-            angle = np.radians(90 - cents * 1.2)
-            x = center_x + (radius - 20) * np.cos(angle)
-            y = center_y - (radius - 20) * np.sin(angle)
-            self.canvas.create_line(center_x, center_y, x, y, fill="red", width=3)
+        self.needle = self.canvas.create_line(GAUGE_CX, GAUGE_CY, GAUGE_CX, GAUGE_CY,
+                                              fill="red", width=3, state=tk.HIDDEN)
+
+    def draw_needle(self, cents):
+        if cents is None:
+            self.canvas.itemconfigure(self.needle, state=tk.HIDDEN)
+            return
+        cents = max(-50, min(50, cents))
+        angle = np.radians(90 - cents * 1.2)
+        x = GAUGE_CX + (GAUGE_RADIUS - 20) * np.cos(angle)
+        y = GAUGE_CY - (GAUGE_RADIUS - 20) * np.sin(angle)
+        self.canvas.coords(self.needle, GAUGE_CX, GAUGE_CY, x, y)
+        self.canvas.itemconfigure(self.needle, state=tk.NORMAL)
+
+    def render(self):
+        # Runs on the Tk thread. The analysis thread only ever replaces
+        # self.pending, so readings that arrive between frames coalesce
+        # into the newest one.
+        reading, self.pending = self.pending, None
+        if reading is not None and self.running:
+            note, detected, cents = reading
+            last = self.shown
+            unchanged = (last is not None and last[0] == note and
+                         (cents is None) == (last[2] is None) and
+                         (cents is None or abs(cents - last[2]) < DISPLAY_CENTS_THRESHOLD))
+            if not unchanged:
+                self.shown = reading
+                self.note_label.config(text=note)
+                if detected is not None:
+                    self.freq_label.config(text=f"{detected:.2f} Hz   Δ {cents:+.1f} cents")
+                else:
+                    self.freq_label.config(text="No signal")
+                self.draw_needle(cents)
+        if self.running:
+            self.root.after(RENDER_INTERVAL_MS, self.render)
 
     def update_loop(self):
         while self.running:
-            self.lock = True
-            buffer_copy = self.audio_buffer.copy()
-            self.lock = False
+            if not self.data_ready.wait(timeout=0.5):
+                continue
+            self.data_ready.clear()
+
+            written = self.ring.written
+            if written < self.window_size:
+                continue
+            self.skipped_windows += max(0, (written - self.analysed_upto) // self.hop_size - 1)
+            self.analysed_upto = written
 
-            freq = self.autocorrelate(buffer_copy)
-            note, detected, cents = self.find_nearest_note(freq)
+            older, newer = self.ring.latest(self.window_size)
+            np.concatenate((older, newer), out=self.window)
 
-            self.note_label.config(text=note)
-            if detected is not None:
-                self.freq_label.config(text=f"{detected:.2f} Hz   Δ {cents:+.1f} cents")
-            else:
-                self.freq_label.config(text="No signal")
-            self.draw_needle(cents)
-            time.sleep(0.05)
+            # Room noise between notes never reaches the estimator
+            freq = self.estimator.estimate(self.window) if self.gate.update(self.window) else None
+            self.pending = self.find_nearest_note(freq)
 
     def stop(self):
         self.running = False
+        print(self.gate.report())
+        print(self.estimator.cost_report())
+        print(f"Skipped {self.skipped_windows} windows under load")
         self.stream.stop()
         self.stream.close()
         self.root.destroy()
@@ -0,0 +1,30 @@
+#wav_io.py
+#
+# WAV reading and resampling with numpy only, so headless paths (the
+# detector, bench, analyze_takes workers) never import pygame.
+
+import wave
+
+import numpy as np
+
+
+def read_wav(path):
+    """Reads a 16-bit WAV as mono int16 samples. Returns (samples, sample_rate)."""
+    with wave.open(path, 'rb') as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit WAV files are supported")
+        channels = wf.getnchannels()
+        rate = wf.getframerate()
+        data = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+    if channels > 1:
+        data = data.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return data, rate
+
+
+def resample(samples, from_rate, to_rate):
+    """Linear-interpolation resample; the result keeps the dtype of samples (int16 or float)."""
+    if from_rate == to_rate:
+        return samples
+    n = int(round(len(samples) * to_rate / from_rate))
+    positions = np.arange(n) * (from_rate / to_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(samples.dtype)